@@ -1,122 +1,749 @@
 import os
 import json
-from pathlib import Path
-from datetime import datetime
-import smtplib
+import gzip
+import time
+import random
+import hashlib
+import secrets
+import re
+import base64
+import threading
+from functools import cache
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta, timezone
 from email.message import EmailMessage
 
 from flask import (
-    Flask, render_template, request, redirect, url_for,
-    session, flash, jsonify
+    Flask, Blueprint, render_template, request, redirect, url_for,
+    session, flash, jsonify, g, make_response, current_app,
+    before_render_template, template_rendered
 )
-from flask_sqlalchemy import SQLAlchemy
+from markupsafe import Markup, escape
+from sqlalchemy import update, delete, select, func, text, event, tuple_
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import load_only, Session
 from dotenv import load_dotenv
+from werkzeug.local import LocalProxy
 import stripe
 
+from stripe_client import CircuitOpenError, gateway_from_env
+from mailer import MailQueue
+from cart_store import create_cart_store
+from images import ImageManifest, OUTPUT_DIR as IMAGE_OUTPUT_DIR
+from facets import FacetIndex, facet_values, FACETS
+from query_profiler import QueryProfiler
+import metrics
+from models import (
+    db, configure_db, init_db, utcnow, BASE_DIR, SQLITE_BUSY_TIMEOUT_MS,
+    Product, Order, WebhookEvent, StockHold, ProcessedEvent,
+)
+
+# Opcionales: orjson serializa mucho más rápido; brotli comprime mejor que gzip
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 # ------------------------------
 # Cargar variables de entorno
 # ------------------------------
 load_dotenv()
 
-BASE_DIR = Path(__file__).resolve().parent
-
 # Variables importantes (configura en .env)
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")  # sk_test_...
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")  # opcional (para validar webhooks)
 SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key")
 STRIPE_PUBLIC_KEY = os.getenv("STRIPE_PUBLIC_KEY")
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "30"))  # segundos
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "512"))  # páginas HTML
+FACET_REFRESH_INTERVAL = float(os.getenv("FACET_REFRESH_INTERVAL", "30"))  # segundos
+CATALOG_PAGE_SIZE = int(os.getenv("CATALOG_PAGE_SIZE", "12"))  # tarjetas por proveedor y carga
+ADMIN_PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", "50"))
+API_PAGE_SIZE = int(os.getenv("API_PAGE_SIZE", "100"))
+API_MAX_PAGE_SIZE = int(os.getenv("API_MAX_PAGE_SIZE", "1000"))
+API_CACHE_SIZE = int(os.getenv("API_CACHE_SIZE", "256"))  # cuerpos JSON ya codificados
+API_COMPRESS_MIN_BYTES = int(os.getenv("API_COMPRESS_MIN_BYTES", "1024"))
+CART_STORE = os.getenv("CART_STORE", "memory")  # memory | sqlite (varios workers)
+CART_TTL = float(os.getenv("CART_TTL", str(7 * 24 * 3600)))  # segundos sin cambios
+CART_MAX_CARTS = int(os.getenv("CART_MAX_CARTS", "10000"))  # solo memory (LRU)
+CART_DB_PATH = os.getenv("CART_DB_PATH", str(BASE_DIR / "carts.db"))
+# Apartado de stock mientras dura la sesión de Stripe. Stripe exige de 30 min
+# a 24 h contados al recibir la petición: el mínimo de 31 cubre la latencia
+CHECKOUT_HOLD_MINUTES = min(max(int(os.getenv("CHECKOUT_HOLD_MINUTES", "31")), 31), 24 * 60)
+HOLD_GRACE_SECONDS = int(os.getenv("HOLD_GRACE_SECONDS", "120"))  # margen para webhooks tardíos
+HOLD_SWEEP_INTERVAL = float(os.getenv("HOLD_SWEEP_INTERVAL", "30"))  # segundos
+HOLD_SWEEP_BATCH = int(os.getenv("HOLD_SWEEP_BATCH", "500"))
+WEBHOOK_MODE = os.getenv("WEBHOOK_MODE", "inline")  # inline | queue
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "2"))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "8"))
+EVENT_LEDGER_LRU_SIZE = int(os.getenv("EVENT_LEDGER_LRU_SIZE", "10000"))
+# Correo saliente (para un stub local: SMTP_HOST=127.0.0.1 SMTP_PORT=1025 SMTP_USE_SSL=0).
+# Sin SMTP_USER no se hace login; con Gmail hay que definir SMTP_USER y SMTP_PASSWORD
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "465"))
+SMTP_USER = os.getenv("SMTP_USER", "")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
+SMTP_USE_SSL = os.getenv("SMTP_USE_SSL", "1") == "1"
+MAIL_FROM = os.getenv("MAIL_FROM") or SMTP_USER or "tu_email@gmail.com"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # si se define, /metrics pide "Bearer <token>"
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"  # desglose visible en el navegador
+QUERY_PROFILER = os.getenv("QUERY_PROFILER", "0") == "1"  # solo desarrollo: N+1 y consultas lentas
+QUERY_PROFILER_REPEAT = int(os.getenv("QUERY_PROFILER_REPEAT", "5"))  # misma forma de SQL por petición
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+
+# ------------------------------
+# Servicios externos (se crean al primer uso)
+# ------------------------------
+# Importar este módulo no toca Stripe ni SMTP: los workers de gunicorn
+# arrancan rápido y las herramientas no necesitan las credenciales.
+@cache
+def get_stripe_gateway():
+    if not STRIPE_SECRET_KEY:
+        raise RuntimeError("Define STRIPE_SECRET_KEY en tu archivo .env")
+    stripe.api_key = STRIPE_SECRET_KEY
+    # Timeouts, reintentos y breaker: variables STRIPE_* (ver stripe_client.py)
+    return gateway_from_env(observer=observe_external_call)
+
+
+@cache
+def get_mail_queue():
+    return MailQueue(
+        SMTP_HOST, SMTP_PORT,
+        username=SMTP_USER, password=SMTP_PASSWORD, use_ssl=SMTP_USE_SSL,
+        observer=observe_external_call,
+    )
+
+
+stripe_gateway = LocalProxy(get_stripe_gateway)
+mail_queue = LocalProxy(get_mail_queue)
+cart_store = create_cart_store(
+    CART_STORE, CART_TTL,
+    maxsize=CART_MAX_CARTS, path=CART_DB_PATH, busy_timeout_ms=SQLITE_BUSY_TIMEOUT_MS,
+)
+
+# Rutas y hooks de la tienda; create_app() los registra en la aplicación
+bp = Blueprint("tienda", __name__)
+
+# ------------------------------
+# Métricas (Prometheus en /metrics)
+# ------------------------------
+HTTP_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+metrics_registry = metrics.Registry()
+http_requests = metrics_registry.counter(
+    "tienda_http_requests_total", "Peticiones atendidas.", ("endpoint", "method", "status"))
+http_latency = metrics_registry.histogram(
+    "tienda_http_request_duration_seconds", "Latencia por endpoint.", ("endpoint",))
+http_sql_queries = metrics_registry.histogram(
+    "tienda_http_request_sql_queries", "Consultas SQL por petición.", ("endpoint",),
+    buckets=metrics.COUNT_BUCKETS)
+http_sql_seconds = metrics_registry.histogram(
+    "tienda_http_request_sql_seconds", "Tiempo en SQL por petición.", ("endpoint",))
+sql_latency = metrics_registry.histogram(
+    "tienda_sql_query_duration_seconds", "Duración de cada sentencia SQL (también fuera de peticiones).")
+template_latency = metrics_registry.histogram(
+    "tienda_template_render_seconds", "Render de plantillas.", ("template",))
+external_latency = metrics_registry.histogram(
+    "tienda_external_call_duration_seconds", "Llamadas salientes a Stripe y SMTP (cada intento).",
+    ("service", "operation", "outcome"))
+
+
+def mail_queue_depth():
+    if not get_mail_queue.cache_info().currsize:
+        return 0  # todavía no se ha enviado nada
+    return mail_queue._queue.qsize() + len(mail_queue._retries)
+
+
+def stripe_circuit_open():
+    if not get_stripe_gateway.cache_info().currsize:
+        return 0
+    return int(stripe_gateway.breaker.state == "open")
+
+
+metrics_registry.gauge(
+    "tienda_mail_queue_depth", "Correos en cola o esperando reintento.", mail_queue_depth)
+metrics_registry.gauge(
+    "tienda_stripe_circuit_open", "1 si el circuit breaker de Stripe no deja pasar llamadas.",
+    stripe_circuit_open)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def sql_started(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def sql_finished(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - context._metrics_started
+    sql_latency.observe(seconds)
+    metrics.record_sql(seconds)
+
+
+def template_started(sender, template, context, **extra):
+    metrics.template_started()
+
+
+def template_finished(sender, template, context, **extra):
+    seconds = metrics.template_finished()
+    if seconds is not None:
+        template_latency.observe(seconds, template.name or "<string>")
+
+
+def observe_external_call(service, operation, seconds, outcome):
+    external_latency.observe(seconds, service, operation, outcome)
+    metrics.record_external(service, seconds)
+
+
+def finish_request_metrics(timings, method, status):
+    endpoint = timings.endpoint or "unmatched"  # 404/405: sin regla, sin etiqueta nueva
+    http_requests.inc(endpoint, method if method in HTTP_METHODS else "OTHER", str(status))
+    http_latency.observe(timings.elapsed(), endpoint)
+    http_sql_queries.observe(timings.sql_count, endpoint)
+    http_sql_seconds.observe(timings.sql_seconds, endpoint)
+
+
+@bp.teardown_app_request
+def capture_metrics_endpoint(exc):
+    timings = metrics.current_timings()
+    if timings is not None:
+        timings.endpoint = request.endpoint
+
+
+@bp.after_app_request
+def add_server_timing(response):
+    timings = metrics.current_timings()
+    if SERVER_TIMING and timings is not None:
+        response.headers["Server-Timing"] = timings.server_timing()
+    return response
+
+
+# Detector de N+1: profile() siempre está disponible para las pruebas; los
+# perfiles por petición solo con QUERY_PROFILER=1 (ver create_app)
+query_profiler = QueryProfiler(Engine, repeat_threshold=QUERY_PROFILER_REPEAT, slow_ms=SLOW_QUERY_MS)
+
+# ------------------------------
+# Caché del catálogo (index)
+# ------------------------------
+class CatalogCache:
+    """Guarda en memoria el catálogo agrupado por proveedor.
+
+    Se invalida por versión (cada cambio de catálogo llama a ``invalidate``)
+    y por TTL, para que otro proceso que modifique la BD no deje stock
+    desactualizado por mucho tiempo.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._value = None
+        self._value_version = -1
+        self._expires_at = 0.0
+
+    def get(self, loader):
+        with self._lock:
+            if self._value_version == self.version and time.monotonic() < self._expires_at:
+                self.hits += 1
+                return self._value
+            self.misses += 1
+            version = self.version
+        value = loader()
+        with self._lock:
+            # Si alguien invalidó mientras cargábamos, no guardamos datos viejos
+            if version == self.version:
+                self._value = value
+                self._value_version = version
+                self._expires_at = time.monotonic() + self.ttl
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._value = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "version": self.version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "ttl": self.ttl,
+            }
+
+
+catalog_cache = CatalogCache(CATALOG_CACHE_TTL)
+api_catalog_cache = CatalogCache(CATALOG_CACHE_TTL)
+
+
+def invalidate_stock_views():
+    # Las vistas cacheadas que muestran disponibilidad
+    catalog_cache.invalidate()
+    api_catalog_cache.invalidate()
 
-if not STRIPE_SECRET_KEY:
-    raise RuntimeError("Define STRIPE_SECRET_KEY en tu archivo .env")
 
-stripe.api_key = STRIPE_SECRET_KEY
+class LRUCache:
+    """Diccionario acotado que descarta lo menos usado recientemente."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return len(self._data)
+
+
+# HTML ya renderizado, indexado por versión (producto o catálogo)
+rendered_pages = LRUCache(RENDER_CACHE_SIZE)
+
+
+# Columnas que muestran las tarjetas del index; el texto largo
+# (descripción, ingredientes, etc.) solo se carga en producto_detalle
+LISTING_COLUMNS = (
+    Product.id, Product.supplier, Product.name, Product.image, Product.price_cents,
+    Product.version, Product.updated_at,
+)
+
+CatalogSnapshot = namedtuple("CatalogSnapshot", "sections etag last_modified")
+# Carrusel de un proveedor: primera página y cursor (último id) si hay más
+CatalogSection = namedtuple("CatalogSection", "supplier title products next_cursor")
+
+
+def listing_query(*columns):
+    """Consulta de listados: solo las columnas dadas, ordenada por proveedor."""
+    return (
+        Product.query
+        .options(load_only(*(columns or LISTING_COLUMNS)))
+        .order_by(Product.supplier, Product.id)
+    )
+
+
+# Proveedores distintos con un "loose index scan": un salto por proveedor en
+# ix_products_supplier en vez de recorrer todas las filas
+SUPPLIERS_SQL = text("""
+    WITH RECURSIVE s(supplier) AS (
+        SELECT MIN(supplier) FROM products
+        UNION ALL
+        SELECT (SELECT MIN(supplier) FROM products WHERE supplier > s.supplier)
+        FROM s WHERE s.supplier IS NOT NULL
+    )
+    SELECT supplier FROM s WHERE supplier IS NOT NULL
+""")
+
+
+def list_suppliers():
+    return db.session.execute(SUPPLIERS_SQL).scalars().all()
+
+
+def paginate(products, size):
+    """Recorta a ``size`` y devuelve (página, cursor) si había una fila extra."""
+    if len(products) > size:
+        products = products[:size]
+        return products, products[-1].id
+    return products, None
+
+
+def supplier_page(supplier, after=0, size=CATALOG_PAGE_SIZE):
+    """Siguiente página de un proveedor con keyset (supplier, id) > (supplier, after)."""
+    products = (
+        listing_query()
+        .filter(Product.supplier == supplier, Product.id > after)
+        .limit(size + 1)
+        .all()
+    )
+    return paginate(products, size)
+
+
+def load_catalog():
+    """Carga la primera página de cada proveedor con su ETag y fecha de modificación.
+
+    El ETag sale de los pares (id, versión) mostrados y, como la página
+    también lleva los conteos de facetas de todo el catálogo, del total de
+    productos y el ``updated_at`` más reciente. Es el mismo en todos los
+    workers que vean los mismos datos.
+    """
+    sections = []
+    for supplier in list_suppliers():
+        products, cursor = supplier_page(supplier)
+        sections.append(CatalogSection(supplier, supplier or "Otros", products, cursor))
+    shown = [p for section in sections for p in section.products]
+    for p in shown:
+        # Los objetos se guardan en caché: se separan de la sesión para que
+        # un commit posterior no los expire
+        db.session.expunge(p)
+    total, newest = db.session.query(func.count(Product.id), func.max(Product.updated_at)).one()
+    digest = hashlib.sha1()
+    digest.update(f"{total}@{newest};".encode())
+    for section in sections:
+        digest.update(f"{section.supplier}>{section.next_cursor};".encode())
+    for p in shown:
+        digest.update(f"{p.id}:{p.version};".encode())
+    return CatalogSnapshot(sections, f"catalog-{digest.hexdigest()[:20]}", newest)
 
 # ------------------------------
-# Configurar Flask y SQLAlchemy
+# Facetas del catálogo (filtros con conteo)
 # ------------------------------
-app = Flask(__name__, template_folder="templates", static_folder="static")
-app.config["SECRET_KEY"] = SECRET_KEY
-app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{BASE_DIR / 'database.db'}"
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+FACET_COLUMNS = (
+    Product.id, Product.brand, Product.supplier, Product.price_cents,
+    Product.weight, Product.allergens, Product.updated_at,
+)
+
+# Faceta -> (parámetro en la URL, título en el formulario)
+FACET_PARAMS = {
+    "brand": ("marca", "Marca"),
+    "supplier": ("proveedor", "Proveedor"),
+    "price": ("precio", "Precio"),
+    "weight": ("peso", "Contenido"),
+    "allergen": ("sin", "Alérgenos"),
+}
+
+
+class CatalogFacets:
+    """Mantiene un FacetIndex sincronizado con la tabla products.
+
+    Los cambios hechos en este proceso marcan los ids afectados al hacer
+    commit y se reindexan en la siguiente consulta. Los de otros procesos
+    (populate.py, otros workers) se detectan cada ``refresh_interval``
+    segundos buscando filas con ``updated_at`` posterior a la última vista.
+    """
 
-db = SQLAlchemy(app)
+    def __init__(self, refresh_interval):
+        self.index = FacetIndex()
+        self.refresh_interval = refresh_interval
+        self.stale = set()
+        self.built = False
+        self.watermark = None
+        self.checked_at = 0.0
+        self._lock = threading.RLock()
+
+    def mark_stale(self, ids):
+        with self._lock:
+            self.stale.update(ids)
+
+    def _load(self, rows):
+        for row in rows:
+            self.index.add(row.id, facet_values(row))
+            if row.updated_at and (self.watermark is None or row.updated_at > self.watermark):
+                self.watermark = row.updated_at
+
+    def rebuild(self):
+        with self._lock:
+            self.index.clear()
+            self.watermark = None
+            self._load(db.session.query(*FACET_COLUMNS))
+            self.built = True
+            self.stale.clear()
+            self.checked_at = time.monotonic()
+
+    def _refresh_ids(self, ids):
+        found = db.session.query(*FACET_COLUMNS).filter(Product.id.in_(ids)).all()
+        self._load(found)
+        for missing in set(ids) - {row.id for row in found}:
+            self.index.remove(missing)
+
+    def get(self):
+        with self._lock:
+            if not self.built:
+                self.rebuild()
+                return self.index
+            if self.stale:
+                ids, self.stale = self.stale, set()
+                self._refresh_ids(ids)
+            if time.monotonic() - self.checked_at >= self.refresh_interval:
+                self.checked_at = time.monotonic()
+                if self.watermark is not None:
+                    changed = db.session.query(*FACET_COLUMNS).filter(Product.updated_at >= self.watermark)
+                    self._load(changed)
+                if db.session.query(func.count(Product.id)).scalar() != len(self.index):
+                    self.rebuild()  # hubo altas sin updated_at o bajas
+            return self.index
+
+
+catalog_facets = CatalogFacets(FACET_REFRESH_INTERVAL)
+
+
+@event.listens_for(Session, "after_flush")
+def collect_changed_products(session, flush_context):
+    changed = session.info.setdefault("changed_products", set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Product) and obj.id is not None:
+            changed.add(obj.id)
+
+
+@event.listens_for(Session, "after_commit")
+def mark_changed_products(session):
+    changed = session.info.pop("changed_products", None)
+    if changed:
+        catalog_facets.mark_stale(changed)
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_changed_products(session):
+    session.info.pop("changed_products", None)
+
+
+def parse_facet_filters(args):
+    filters = {}
+    for facet, (param, _) in FACET_PARAMS.items():
+        values = [v for v in args.getlist(param) if v]
+        if values:
+            filters["sin" if facet == "allergen" else facet] = values
+    return filters
+
+
+def facet_panel(index, filters):
+    """Opciones de cada faceta con su conteo, listas para la plantilla."""
+    counts = index.counts(filters)
+    panel = []
+    for facet in FACETS + ("allergen",):
+        param, title = FACET_PARAMS[facet]
+        selected = set(filters.get("sin" if facet == "allergen" else facet, ()))
+        options = [
+            {"value": value, "label": label, "count": count, "checked": value in selected}
+            for value, label, count in counts[facet]
+        ]
+        if options:
+            panel.append({"param": param, "title": title, "options": options})
+    return panel
+
+def load_listing_by_ids(ids):
+    by_id = {p.id: p for p in listing_query().filter(Product.id.in_(ids))}
+    return [by_id[i] for i in ids if i in by_id]
+
+
+def filtered_supplier_page(facet_index, match, supplier, after=0, size=CATALOG_PAGE_SIZE):
+    """Como supplier_page, pero tomando los ids del bitmap de facetas."""
+    bitmap = match & facet_index.bitmaps["supplier"].get(supplier, 0)
+    # Se descartan los bits <= after antes de extraer los ids
+    after = max(after, 0)
+    bitmap >>= after + 1
+    ids = [i + after + 1 for i in FacetIndex.ids(bitmap)[:size + 1]]
+    return ids[:size], (ids[size - 1] if len(ids) > size else None)
+
+
+def filtered_sections(filters):
+    facet_index = catalog_facets.get()
+    match = facet_index.match(filters)
+    pages = []
+    for supplier in sorted(facet_index.bitmaps["supplier"]):
+        ids, cursor = filtered_supplier_page(facet_index, match, supplier)
+        if ids:
+            pages.append((supplier, ids, cursor))
+    # Una sola consulta para las tarjetas de todos los proveedores
+    products = {p.id: p for p in load_listing_by_ids([i for _, ids, _ in pages for i in ids])}
+    sections = [
+        CatalogSection(supplier, supplier, [products[i] for i in ids if i in products], cursor)
+        for supplier, ids, cursor in pages
+    ]
+    return facet_index, sections
+
+
+def encode_cursor(*values):
+    raw = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        return json.loads(raw)
+    except (ValueError, TypeError):
+        return None
 
 # ------------------------------
-# Modelos
+# Imágenes de producto (derivados de images.py)
 # ------------------------------
-class Product(db.Model):
-    __tablename__ = "products"
-    id = db.Column(db.Integer, primary_key=True)
-    supplier = db.Column(db.String(120), nullable=False)
-    name = db.Column(db.String(120), nullable=False)
-    description = db.Column(db.Text, nullable=True)
-    price_cents = db.Column(db.Integer, nullable=False)
-    image = db.Column(db.String(255), nullable=True)
-    brand = db.Column(db.String(120), nullable=True)
-    weight = db.Column(db.String(50), nullable=True)
-    ingredients = db.Column(db.Text, nullable=True)
-    allergens = db.Column(db.Text, nullable=True)
-    nutritional_info = db.Column(db.Text, nullable=True)
-    stock = db.Column(db.Integer, nullable=False, default=0)
+image_manifest = ImageManifest(BASE_DIR / "static")
+CARD_IMAGE_SIZES = "(max-width: 600px) 120px, 180px"
+
 
-    def price_display(self):
-        return f"{self.price_cents / 100:.2f}"
+def static_max_age(filename):
+    # Los derivados llevan la huella del contenido: se pueden cachear un año
+    if filename.startswith(f"img/{IMAGE_OUTPUT_DIR}/"):
+        return 365 * 24 * 3600
+    return None
 
 
 
-class Order(db.Model):
-    __tablename__ = "orders"
-    id = db.Column(db.Integer, primary_key=True)
-    stripe_session_id = db.Column(db.String(255), nullable=False, unique=True)
-    amount_total = db.Column(db.Integer, nullable=False)  # centavos
-    currency = db.Column(db.String(10), default="usd")
-    paid = db.Column(db.Boolean, default=False)
-    payload = db.Column(db.Text)  # JSON con datos del evento (opcional)
+def _static_url(path):
+    return f"{current_app.static_url_path}/{path}"
+
+
+@bp.app_template_global()
+def product_image(product, css_class="producto-img", sizes=CARD_IMAGE_SIZES, lazy=True, **attrs):
+    """``<picture>`` con WebP y JPEG redimensionados (``srcset``/``sizes``)."""
+    entry = image_manifest.resolve(product.supplier, product.image)
+    alt = product.name if product.supplier and product.image else "Sin imagen"
+    img_attrs = {"src": _static_url(entry["src"]), "alt": alt, "class": css_class}
+    if lazy:
+        img_attrs.update(loading="lazy", decoding="async")
+    img_attrs.update(attrs)
+    if not entry["jpeg"]:
+        return Markup("<img %s>") % Markup(_html_attrs(img_attrs))
+    img_attrs["srcset"] = ", ".join(f"{_static_url(path)} {w}w" for w, path in entry["jpeg"])
+    img_attrs["sizes"] = sizes
+    webp = ", ".join(f"{_static_url(path)} {w}w" for w, path in entry["webp"])
+    return Markup('<picture><source type="image/webp" srcset="%s" sizes="%s"><img %s></picture>') % (
+        webp, sizes, Markup(_html_attrs(img_attrs))
+    )
+
+
+@bp.app_template_global()
+def product_image_url(product):
+    """URL de la variante más grande (p. ej. para ampliar la imagen)."""
+    entry = image_manifest.resolve(product.supplier, product.image)
+    return _static_url(entry["jpeg"][-1][1] if entry["jpeg"] else entry["src"])
+
+
+def _html_attrs(attrs):
+    return " ".join(f'{escape(k)}="{escape(v)}"' for k, v in attrs.items() if v is not None)
 
 # ------------------------------
-# Inicializar DB con productos demo
+# GET condicional (ETag / Last-Modified)
 # ------------------------------
+def _template_fingerprint():
+    # Un despliegue que cambie las plantillas debe cambiar los ETag
+    digest = hashlib.sha1()
+    for path in sorted((BASE_DIR / "templates").rglob("*.html")):
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:8]
+
+
+TEMPLATE_FINGERPRINT = _template_fingerprint()
+
+
+def page_etag(key):
+    # El pie de página muestra el año, así que también forma parte del ETag;
+    # igual las rutas de las imágenes derivadas
+    return f"{key}-{datetime.now().year}-{TEMPLATE_FINGERPRINT}-{image_manifest.version}"
+
+
+def is_not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if last_modified and request.if_modified_since:
+        return last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= request.if_modified_since
+    return False
+
+
+def conditional_page(etag, last_modified, render):
+    """Responde 304 sin renderizar si el cliente ya tiene la versión actual.
 
-def init_db():
-    with app.app_context():
-        db.create_all()
+    Si no, usa el HTML cacheado para ese ETag o llama a ``render()``.
+    """
+    if is_not_modified(etag, last_modified):
+        response = make_response("", 304)
+    else:
+        html = rendered_pages.get(etag)
+        if html is None:
+            html = render()
+            rendered_pages.put(etag, html)
+        response = make_response(html)
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified.replace(tzinfo=timezone.utc)
+    response.headers["Cache-Control"] = "no-cache"  # guardar, pero revalidar
+    return response
 
 # ------------------------------
-# Helpers carrito sesión
+# Helpers carrito (contenido en cart_store, id en la sesión)
 # ------------------------------
-CART_SESSION_KEY = "cart"  # estructura {product_id: cantidad, ...}
+CART_SESSION_KEY = "cart_id"  # la cookie solo lleva este id opaco
+LEGACY_CART_SESSION_KEY = "cart"  # carrito completo en la cookie (versión anterior)
+
+def current_cart_id(create=False):
+    cart_id = session.get(CART_SESSION_KEY)
+    if cart_id is None and create:
+        cart_id = secrets.token_urlsafe(16)
+        session[CART_SESSION_KEY] = cart_id
+    return cart_id
 
-# Guardar el carrito en la sesión
+# Guardar el carrito {product_id (int): cantidad}
 def save_cart(cart):
-    session['cart'] = cart
+    cart = {int(pid): int(qty) for pid, qty in cart.items() if int(qty) > 0}
+    cart_id = current_cart_id(create=bool(cart))
+    if cart_id:
+        cart_store.save(cart_id, cart)
+    g.cart = cart
 
-# Recuperar el carrito de la sesión
+# Recuperar el carrito; se lee del almacén una sola vez por petición
 def get_cart():
-    return session.get('cart', {})
+    if "cart" not in g:
+        legacy = session.pop(LEGACY_CART_SESSION_KEY, None)
+        if legacy:
+            save_cart(legacy)
+        else:
+            cart_id = current_cart_id()
+            g.cart = cart_store.get(cart_id) if cart_id else {}
+    return dict(g.cart)
 
 def add_to_cart(product_id, qty=1):
     cart = get_cart()
-    cart[str(product_id)] = cart.get(str(product_id), 0) + int(qty)
+    cart[int(product_id)] = cart.get(int(product_id), 0) + int(qty)
     save_cart(cart)
 
 def update_cart_item(product_id, qty):
     cart = get_cart()
     if int(qty) <= 0:
-        cart.pop(str(product_id), None)
+        cart.pop(int(product_id), None)
     else:
-        cart[str(product_id)] = int(qty)
+        cart[int(product_id)] = int(qty)
     save_cart(cart)
 
 def clear_cart():
-    session.pop(CART_SESSION_KEY, None)
-    session.modified = True
+    cart_id = session.pop(CART_SESSION_KEY, None)
+    if cart_id:
+        cart_store.delete(cart_id)
+    g.cart = {}
+
+def load_cart_products(cart, extra_ids=()):
+    """Carga en una sola consulta los productos de un carrito {id: cantidad}.
+
+    Devuelve un mapa {id: Product}; el resultado se guarda en ``g`` para
+    reutilizarlo durante el resto de la petición.
+    """
+    ids = {int(pid) for pid in cart} | {int(pid) for pid in extra_ids}
+    loaded = g.setdefault("cart_products", {})
+    missing = ids - loaded.keys()
+    if missing:
+        for p in Product.query.filter(Product.id.in_(missing)):
+            loaded[p.id] = p
+        for pid in missing - loaded.keys():
+            loaded[pid] = None  # no existe; evita volver a consultarlo
+    return {pid: loaded[pid] for pid in ids if loaded[pid] is not None}
 
 def cart_items_with_products():
     cart = get_cart()
+    products = load_cart_products(cart)
     items = []
     total = 0
     for pid, qty in cart.items():
-        p = Product.query.get(int(pid))
+        p = products.get(pid)
         if not p:
             continue
         subtotal = p.price_cents * qty
@@ -124,76 +751,536 @@ def cart_items_with_products():
         total += subtotal
     return items, total
 
+def decrement_stock(cart):
+    """Descuenta el stock de un carrito {id: cantidad} en una sola transacción.
+
+    Cada línea es un ``UPDATE ... WHERE stock >= :qty`` atómico, así que dos
+    webhooks concurrentes no pueden pisarse. Devuelve las líneas que no se
+    pudieron surtir (producto inexistente o stock insuficiente).
+    """
+    unfilled = []
+    try:
+        # Orden fijo por id para que transacciones concurrentes tomen las filas igual
+        for pid, qty in sorted((int(pid), int(qty)) for pid, qty in cart.items()):
+            if qty < 1:
+                continue
+            # Lo apartado por otros checkouts no se puede tomar
+            result = db.session.execute(
+                update(Product)
+                .where(Product.id == pid, Product.stock - Product.reserved >= qty)
+                .values(stock=Product.stock - qty, version=Product.version + 1)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 0:
+                unfilled.append({"product_id": pid, "quantity": qty})
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return unfilled
+
+# ------------------------------
+# Apartados de stock durante el checkout
+# ------------------------------
+def reserve_stock(cart, hold_id, cart_id, expires_at):
+    """Aparta todo el carrito o nada; devuelve los ids sin stock suficiente.
+
+    Cada línea es un ``UPDATE ... WHERE stock - reserved >= :qty`` atómico
+    más su fila en stock_holds, todo en una transacción.
+    """
+    short = []
+    try:
+        for pid, qty in sorted(cart.items()):
+            result = db.session.execute(
+                update(Product)
+                .where(Product.id == pid, Product.stock - Product.reserved >= qty)
+                .values(reserved=Product.reserved + qty, version=Product.version + 1)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 0:
+                short.append(pid)
+                continue
+            db.session.add(StockHold(
+                hold_id=hold_id, cart_id=cart_id, product_id=pid,
+                quantity=qty, expires_at=expires_at,
+            ))
+        if short:
+            db.session.rollback()
+        else:
+            db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return short
+
+
+def release_holds(*criteria):
+    """Borra los apartados que cumplan ``criteria`` y devuelve su stock.
+
+    El ``DELETE ... RETURNING`` solo devuelve las filas que este proceso
+    borró, así que un apartado nunca se libera dos veces aunque barran
+    varios workers a la vez. No confirma: lo hace quien llama.
+    """
+    rows = db.session.execute(
+        delete(StockHold).where(*criteria).returning(StockHold.product_id, StockHold.quantity)
+    ).all()
+    released = {}
+    for pid, qty in rows:
+        released[pid] = released.get(pid, 0) + qty
+    for pid, qty in sorted(released.items()):
+        db.session.execute(
+            update(Product)
+            .where(Product.id == pid)
+            .values(reserved=func.max(Product.reserved - qty, 0), version=Product.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+    return released
+
 # ------------------------------
 # Rutas públicas
 # ------------------------------
-@app.route("/")
+@bp.route("/")
 def index():
-    products = Product.query.all()
-    products_by_supplier = {}
-    for p in products:
-        proveedor = p.supplier or "Otros"
-        if proveedor not in products_by_supplier:
-            products_by_supplier[proveedor] = []
-        products_by_supplier[proveedor].append(p)
-    return render_template(
-        "index.html",
-        products_by_supplier=products_by_supplier,
-        now=datetime.now()  # <-- agrega esto
+    filters = parse_facet_filters(request.args)
+    if filters:
+        # Vista filtrada: la intersección de bitmaps decide qué tarjetas quedan
+        facet_index, sections = filtered_sections(filters)
+        return render_template(
+            "index.html",
+            secciones=sections,
+            facetas=facet_panel(facet_index, filters),
+            filtros_activos=True,
+            now=datetime.now(),
+        )
+    catalog = catalog_cache.get(load_catalog)
+    return conditional_page(
+        page_etag(catalog.etag),
+        catalog.last_modified,
+        lambda: render_template(
+            "index.html",
+            secciones=catalog.sections,
+            facetas=facet_panel(catalog_facets.get(), {}),
+            filtros_activos=False,
+            now=datetime.now()  # <-- agrega esto
+        ),
     )
 
 
-@app.route("/producto/<int:product_id>")
+@bp.route("/catalogo")
+def catalogo_pagina():
+    """Fragmento con la siguiente página de tarjetas de un proveedor.
+
+    Lo piden los carruseles del index al llegar al final; el cursor de la
+    página siguiente va en la cabecera ``X-Next-Cursor``.
+    """
+    supplier = request.args.get("proveedor", "")
+    after = request.args.get("despues", 0, type=int)
+    filters = parse_facet_filters(request.args)
+    if filters:
+        facet_index = catalog_facets.get()
+        ids, cursor = filtered_supplier_page(facet_index, facet_index.match(filters), supplier, after)
+        products = load_listing_by_ids(ids)
+    else:
+        products, cursor = supplier_page(supplier, after)
+    response = make_response(render_template("_tarjetas.html", productos=products))
+    response.headers["X-Next-Cursor"] = cursor or ""
+    return response
+
+
+@bp.route("/producto/<int:product_id>")
 def producto_detalle(product_id):
-    producto = Product.query.get_or_404(product_id)
-    return render_template("producto.html", producto=producto, now=datetime.now())
+    # Solo la versión: el producto completo se carga si hay que renderizar
+    meta = (
+        db.session.query(Product.version, Product.updated_at)
+        .filter(Product.id == product_id)
+        .first_or_404()
+    )
+    return conditional_page(
+        page_etag(f"p{product_id}-v{meta.version}"),
+        meta.updated_at,
+        lambda: render_template(
+            "producto.html",
+            producto=Product.query.get_or_404(product_id),
+            now=datetime.now(),
+        ),
+    )
+
+
+# ------------------------------
+# Búsqueda (FTS5)
+# ------------------------------
+SEARCH_MAX_TERMS = 8
+SEARCH_MAX_RESULTS = 100
+# Pesos BM25 por columna: name, description, brand, ingredients, allergens
+SEARCH_SQL = text("""
+    SELECT p.id, p.supplier, p.name, p.brand, p.weight, p.image, p.price_cents
+    FROM products_fts
+    JOIN products AS p ON p.id = products_fts.rowid
+    WHERE products_fts MATCH :query
+    ORDER BY bm25(products_fts, 10.0, 2.0, 5.0, 1.0, 1.0)
+    LIMIT :limit
+""")
+
+
+def build_match_query(raw):
+    """Convierte texto libre en una consulta FTS5 segura con prefijos.
+
+    Cada palabra se cita (así la sintaxis de FTS5 del usuario no aplica) y
+    lleva ``*`` para buscar por prefijo; todas deben aparecer.
+    """
+    terms = re.findall(r"\w+", raw or "")[:SEARCH_MAX_TERMS]
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def search_products(raw, limit=20):
+    query = build_match_query(raw)
+    if not query:
+        return []
+    limit = max(1, min(limit, SEARCH_MAX_RESULTS))
+    return db.session.execute(SEARCH_SQL, {"query": query, "limit": limit}).all()
+
+
+@bp.route("/buscar")
+def buscar():
+    q = request.args.get("q", "").strip()
+    resultados = search_products(q, request.args.get("limit", 40, type=int))
+    return render_template("buscar.html", q=q, resultados=resultados, now=datetime.now())
+
+
+@bp.route("/buscar.json")
+def buscar_json():
+    q = request.args.get("q", "").strip()
+    resultados = search_products(q, request.args.get("limit", 20, type=int))
+    return jsonify(
+        q=q,
+        results=[
+            {
+                "id": r.id,
+                "name": r.name,
+                "supplier": r.supplier,
+                "brand": r.brand,
+                "weight": r.weight,
+                "price": f"{r.price_cents / 100:.2f}",
+                "url": url_for("tienda.producto_detalle", product_id=r.id),
+            }
+            for r in resultados
+        ],
+    )
+
+# ------------------------------
+# API JSON v1 (solo lectura)
+# ------------------------------
+API_FIELDS = (
+    "id", "name", "supplier", "brand", "description", "price", "price_cents",
+    "currency", "weight", "ingredients", "allergens", "nutritional_info",
+    "in_stock", "image_url", "url", "version", "updated_at",
+)
+API_COLUMNS = (
+    Product.id, Product.supplier, Product.name, Product.description,
+    Product.price_cents, Product.image, Product.brand, Product.weight,
+    Product.ingredients, Product.allergens, Product.nutritional_info,
+    Product.stock, Product.reserved, Product.version, Product.updated_at,
+)
+
+# Catálogo precalculado en orden de id: dicts, su JSON ya codificado y versiones
+ApiCatalog = namedtuple("ApiCatalog", "ids rows encoded versions")
+
+# Cuerpos de respuesta (y sus versiones comprimidas) por ETag
+api_bodies = LRUCache(API_CACHE_SIZE)
+
+
+def json_dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def api_product_dict(p):
+    return {
+        "id": p.id,
+        "name": p.name,
+        "supplier": p.supplier,
+        "brand": p.brand,
+        "description": p.description,
+        "price": p.price_display(),
+        "price_cents": p.price_cents,
+        "currency": "usd",
+        "weight": p.weight,
+        "ingredients": p.ingredients,
+        "allergens": p.allergens,
+        "nutritional_info": p.nutritional_info,
+        "in_stock": p.available_stock > 0,
+        "image_url": (
+            url_for("static", filename=f"img/{p.supplier}/{p.image}")
+            if p.supplier and p.image else None
+        ),
+        "url": url_for("tienda.producto_detalle", product_id=p.id),
+        "version": p.version,
+        "updated_at": p.updated_at.replace(tzinfo=timezone.utc).isoformat() if p.updated_at else None,
+    }
+
+
+def load_api_catalog():
+    """Serializa todo el catálogo una vez; las peticiones solo recortan y unen."""
+    products = Product.query.options(load_only(*API_COLUMNS)).order_by(Product.id).all()
+    rows = [api_product_dict(p) for p in products]
+    return ApiCatalog(
+        [p.id for p in products],
+        rows,
+        [json_dumps(row) for row in rows],
+        [p.version for p in products],
+    )
+
+
+def parse_api_fields(raw):
+    """``fields=a,b`` -> tupla en orden canónico (siempre con id); None = todos."""
+    if not raw:
+        return None
+    requested = {f.strip() for f in raw.split(",") if f.strip()}
+    unknown = requested.difference(API_FIELDS)
+    if unknown:
+        raise ValueError(f"Campos desconocidos: {', '.join(sorted(unknown))}")
+    return tuple(f for f in API_FIELDS if f == "id" or f in requested)
+
+
+def encode_api_rows(catalog, start, end, fields):
+    if fields is None:
+        return b",".join(catalog.encoded[start:end])
+    return b",".join(
+        json_dumps({f: row[f] for f in fields}) for row in catalog.rows[start:end]
+    )
+
+
+def api_etag(kind, catalog, start, end, fields, extra=""):
+    # Solo las versiones de lo que se devuelve: un cambio en otra página no
+    # invalida esta
+    digest = hashlib.sha1(f"{kind}|{','.join(fields or ('*',))}|{extra}|".encode())
+    for product_id, version in zip(catalog.ids[start:end], catalog.versions[start:end]):
+        digest.update(f"{product_id}:{version};".encode())
+    return f"api1-{digest.hexdigest()[:20]}"
+
+
+def negotiate_encoding():
+    offered = ("br", "gzip") if brotli is not None else ("gzip",)
+    return request.accept_encodings.best_match(offered)
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+def api_response(etag, build):
+    """Respuesta JSON con revalidación por ETag y compresión negociada.
+
+    El cuerpo y cada variante comprimida se guardan por ETag, así que pedir
+    otra vez el catálogo completo no vuelve a serializar ni a comprimir.
+    """
+    variants = {etag: None, f"{etag}-gzip": "gzip", f"{etag}-br": "br"}
+    if request.if_none_match:
+        for tag in variants:
+            if request.if_none_match.contains(tag):
+                response = make_response("", 304)
+                response.set_etag(tag)
+                response.headers["Cache-Control"] = "no-cache"
+                response.vary.add("Accept-Encoding")
+                return response
+    body = api_bodies.get(etag)
+    if body is None:
+        body = build()
+        api_bodies.put(etag, body)
+    encoding = negotiate_encoding() if len(body) >= API_COMPRESS_MIN_BYTES else None
+    tag = etag
+    if encoding:
+        tag = f"{etag}-{encoding}"
+        compressed = api_bodies.get(tag)
+        if compressed is None:
+            compressed = compress(body, encoding)
+            api_bodies.put(tag, compressed)
+        body = compressed
+    response = make_response(body)
+    response.content_type = "application/json"
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.set_etag(tag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def api_error(status, message):
+    return jsonify({"error": message}), status
+
+
+@bp.route("/api/v1/products")
+def api_products():
+    """Listado paginado por id: ``limit``, ``after`` (cursor) y ``fields``."""
+    try:
+        fields = parse_api_fields(request.args.get("fields"))
+    except ValueError as e:
+        return api_error(400, str(e))
+    limit = max(1, min(request.args.get("limit", API_PAGE_SIZE, type=int), API_MAX_PAGE_SIZE))
+    after = 0
+    if request.args.get("after"):
+        cursor = decode_cursor(request.args["after"])
+        if not (isinstance(cursor, list) and len(cursor) == 1 and isinstance(cursor[0], int)):
+            return api_error(400, "Cursor inválido")
+        after = cursor[0]
+
+    catalog = api_catalog_cache.get(load_api_catalog)
+    start = bisect_right(catalog.ids, after)
+    end = min(start + limit, len(catalog.ids))
+    next_cursor = encode_cursor(catalog.ids[end - 1]) if end < len(catalog.ids) else None
+
+    def build():
+        tail = json_dumps({
+            "next_cursor": next_cursor,
+            "links": {
+                "next": url_for(
+                    "tienda.api_products", after=next_cursor, limit=limit,
+                    fields=",".join(fields) if fields else None,
+                ) if next_cursor else None,
+            },
+        })
+        return b'{"data":[' + encode_api_rows(catalog, start, end, fields) + b"]," + tail[1:]
+
+    return api_response(api_etag("list", catalog, start, end, fields, f"{limit}|{next_cursor}"), build)
+
+
+@bp.route("/api/v1/products/<int:product_id>")
+def api_product(product_id):
+    try:
+        fields = parse_api_fields(request.args.get("fields"))
+    except ValueError as e:
+        return api_error(400, str(e))
+    catalog = api_catalog_cache.get(load_api_catalog)
+    i = bisect_left(catalog.ids, product_id)
+    if i == len(catalog.ids) or catalog.ids[i] != product_id:
+        return api_error(404, "Producto no encontrado")
+    return api_response(
+        api_etag("item", catalog, i, i + 1, fields),
+        lambda: b'{"data":' + encode_api_rows(catalog, i, i + 1, fields) + b"}",
+    )
 
 
-@app.route("/add-to-cart", methods=["POST"])
+@bp.route("/add-to-cart", methods=["POST"])
 def route_add_to_cart():
-    product_id = request.form.get("product_id")
+    product_id = request.form.get("product_id", type=int)
     cantidad = request.form.get("cantidad", type=int)
-    product = Product.query.get(product_id)
+    product = db.session.get(Product, product_id) if product_id else None
     if not product:
         flash("Producto no encontrado.", "error")
-        return redirect(url_for("index"))
+        return redirect(url_for("tienda.index"))
     if not cantidad or cantidad < 1:
         flash("Cantidad inválida.", "error")
-        return redirect(url_for("producto_detalle", product_id=product_id))
-    if cantidad > product.stock:
+        return redirect(url_for("tienda.producto_detalle", product_id=product_id))
+    if cantidad > product.available_stock:
         flash("No hay suficiente stock disponible.", "error")
-        return redirect(url_for("producto_detalle", product_id=product_id))
+        return redirect(url_for("tienda.producto_detalle", product_id=product_id))
     cart = get_cart()
     cart[product_id] = cart.get(product_id, 0) + cantidad
     save_cart(cart)
     flash("Producto agregado al carrito.", "success")
-    return redirect(url_for("view_cart"))
+    return redirect(url_for("tienda.view_cart"))
 
-@app.route("/cart")
+@bp.route("/cart")
 def view_cart():
     cart = get_cart()
     items, total = cart_items_with_products()
     return render_template("cart.html", items=items, total=total, now=datetime.now())
 
-@app.route("/update-cart", methods=["POST"])
+CART_MAX_OPS = 100
+CART_OPS = ("set", "add", "remove")
+
+
+def apply_cart_ops(ops):
+    """Aplica una lista de operaciones al carrito: todas o ninguna.
+
+    Cada operación es ``{"op": "set"|"add"|"remove", "product_id": id,
+    "quantity": n}``; se aplican en orden (la última gana) y el resultado
+    se valida contra el stock disponible con una sola consulta. Devuelve
+    ``(cart, products, errors)``; si hay errores el carrito no se guarda.
+    """
+    cart = get_cart()
+    touched = []
+    errors = []
+    for i, op in enumerate(ops):
+        kind = op.get("op") if isinstance(op, dict) else None
+        pid = str(op.get("product_id")) if isinstance(op, dict) else ""
+        qty = op.get("quantity", 1) if isinstance(op, dict) else None
+        if kind not in CART_OPS or not pid.isdigit() or not isinstance(qty, int) or isinstance(qty, bool):
+            errors.append({"index": i, "message": "Operación inválida."})
+            continue
+        pid = int(pid)
+        touched.append(pid)
+        if kind == "remove" or (kind == "set" and qty <= 0):
+            cart.pop(pid, None)
+        elif kind == "set":
+            cart[pid] = qty
+        else:
+            cart[pid] = cart.get(pid, 0) + qty
+            if cart[pid] <= 0:
+                cart.pop(pid)
+    products = load_cart_products(cart, extra_ids=touched)
+    for pid in dict.fromkeys(touched):
+        if pid not in cart:
+            continue  # quitar siempre se permite, aunque el producto ya no exista
+        product = products.get(pid)
+        if product is None:
+            errors.append({"product_id": pid, "message": "Producto no encontrado."})
+        elif cart.get(pid, 0) > product.available_stock:
+            errors.append({
+                "product_id": pid,
+                "message": f"Solo hay {product.available_stock} disponibles de {product.name}.",
+                "available": product.available_stock,
+            })
+    if not errors:
+        save_cart(cart)
+    return cart, products, errors
+
+
+def cart_lines_json(cart, products):
+    lines = {
+        str(pid): {"quantity": qty, "subtotal": "%.2f" % (products[pid].price_cents * qty / 100)}
+        for pid, qty in cart.items() if pid in products
+    }
+    total = sum(products[pid].price_cents * qty for pid, qty in cart.items() if pid in products)
+    return lines, "%.2f" % (total / 100)
+
+
+@bp.route("/carrito/lote", methods=["POST"])
+def route_cart_batch():
+    """Varias ediciones del carrito en una sola petición (ver apply_cart_ops)."""
+    data = request.get_json(silent=True) or {}
+    ops = data.get("ops")
+    if not isinstance(ops, list) or not ops or len(ops) > CART_MAX_OPS:
+        return jsonify(success=False, message="Se esperaba una lista 'ops'."), 400
+    cart, products, errors = apply_cart_ops(ops)
+    if errors:
+        status = 400 if any("index" in e for e in errors) else 409
+        return jsonify(success=False, message=errors[0]["message"], errors=errors), status
+    lines, total = cart_lines_json(cart, products)
+    return jsonify(success=True, lines=lines, total=total, count=sum(cart.values()))
+
+
+@bp.route("/update-cart", methods=["POST"])
 def route_update_cart():
     if request.headers.get("X-Requested-With") == "XMLHttpRequest":
-        data = request.get_json()
-        product_id = str(data.get("product_id"))
-        cart = get_cart()
-        product = Product.query.get(product_id)
-        if not product:
-            return jsonify(success=False, message="Producto no encontrado.")
+        # Compatibilidad: una sola edición, misma lógica que /carrito/lote
+        data = request.get_json(silent=True) or {}
         if data.get("remove"):
-            cart.pop(product_id, None)
+            op = {"op": "remove", "product_id": data.get("product_id")}
         else:
-            qty = int(data.get("quantity", 1))
-            if qty < 1 or qty > product.stock:
+            quantity = str(data.get("quantity", 1))
+            if not quantity.isdigit() or int(quantity) < 1:
                 return jsonify(success=False, message="Cantidad inválida.")
-            cart[product_id] = qty
-        save_cart(cart)
-        subtotal = "%.2f" % ((cart.get(product_id, 0) * product.price_cents) / 100) if product_id in cart else "0.00"
-        total = "%.2f" % (sum(Product.query.get(pid).price_cents * qty for pid, qty in cart.items()) / 100)
+            op = {"op": "set", "product_id": data.get("product_id"), "quantity": int(quantity)}
+        cart, products, errors = apply_cart_ops([op])
+        if errors:
+            return jsonify(success=False, message=errors[0]["message"])
+        lines, total = cart_lines_json(cart, products)
+        subtotal = lines.get(str(op["product_id"]), {}).get("subtotal", "0.00")
         return jsonify(success=True, subtotal=subtotal, total=total)
     # --- Manejo tradicional (no AJAX) ---
     # Actualiza cantidades y elimina productos usando request.form
@@ -203,37 +1290,47 @@ def route_update_cart():
     for key in request.form:
         if key.startswith("quantity["):
             pid = key.split("[")[1].split("]")[0]
+            if not pid.isdigit():
+                continue
+            pid = int(pid)
             qty = int(request.form.get(key, 1))
             if qty < 1:
                 cart.pop(pid, None)
             else:
                 cart[pid] = qty
     # Eliminar producto si se envió el botón remove
-    remove_id = request.form.get("remove")
+    remove_id = request.form.get("remove", type=int)
     if remove_id:
         cart.pop(remove_id, None)
     save_cart(cart)
-    return redirect(url_for("view_cart"))
+    return redirect(url_for("tienda.view_cart"))
 
-@app.route("/carrito/eliminar/<int:product_id>", methods=["POST"])
+@bp.route("/carrito/eliminar/<int:product_id>", methods=["POST"])
 def route_remove_from_cart(product_id):
     cart = get_cart()
-    cart.pop(str(product_id), None)  # Elimina el producto del carrito dict
+    cart.pop(product_id, None)  # Elimina el producto del carrito dict
     save_cart(cart)
     flash("Producto eliminado del carrito.", "info")
-    return redirect(url_for("view_cart"))
+    return redirect(url_for("tienda.view_cart"))
 
 # ------------------------------
 # Checkout Stripe
 # ------------------------------
-@app.route("/create-checkout-session", methods=["POST"])
+@bp.route("/create-checkout-session", methods=["POST"])
 def create_checkout_session():
     cart = get_cart()
+    products = load_cart_products(cart)
     line_items = []
+    held = {}
     for pid, qty in cart.items():
-        product = Product.query.get(int(pid))
+        product = products.get(pid)
         if not product or qty < 1:
             continue
+        held[pid] = qty
+        if product.stripe_price_id and product.stripe_price_cents == product.price_cents:
+            # Precio ya sincronizado: basta la referencia
+            line_items.append({'price': product.stripe_price_id, 'quantity': qty})
+            continue
         line_items.append({
             'price_data': {
                 'currency': 'usd',
@@ -246,33 +1343,447 @@ def create_checkout_session():
         })
     if not line_items:
         flash("No hay productos válidos en el carrito.", "error")
-        return redirect(url_for("view_cart"))
-    session_obj = stripe.checkout.Session.create(
-        payment_method_types=["card"],
-        line_items=line_items,
-        mode='payment',
-        success_url=url_for('success', _external=True),
-        cancel_url=url_for('view_cart', _external=True),
-        metadata={'cart_items': json.dumps(cart)}
-    )
+        return redirect(url_for("tienda.view_cart"))
+
+    # Apartar el stock mientras la sesión de Stripe siga abierta; un checkout
+    # anterior del mismo carrito libera primero lo suyo
+    cart_id = current_cart_id()
+    if cart_id:
+        released = release_holds(StockHold.cart_id == cart_id)
+        db.session.commit()
+        if released:
+            # El finally de abajo no corre si se vuelve antes por falta de stock
+            invalidate_stock_views()
+    hold_id = secrets.token_urlsafe(16)
+    # El apartado vence con el mismo timestamp (entero) que se manda a Stripe
+    session_expires_ts = int(time.time()) + CHECKOUT_HOLD_MINUTES * 60
+    session_expires_at = datetime.fromtimestamp(session_expires_ts, timezone.utc).replace(tzinfo=None)
+    short = reserve_stock(held, hold_id, cart_id, session_expires_at + timedelta(seconds=HOLD_GRACE_SECONDS))
+    if short:
+        names = ", ".join(products[pid].name for pid in short)
+        flash(f"Ya no hay stock suficiente de: {names}.", "error")
+        return redirect(url_for("tienda.view_cart"))
+
+    try:
+        session_obj = stripe_gateway.create_checkout_session({
+            "payment_method_types": ["card"],
+            "line_items": line_items,
+            "mode": 'payment',
+            "success_url": url_for('tienda.success', _external=True),
+            "cancel_url": url_for('tienda.view_cart', _external=True),
+            "expires_at": session_expires_ts,
+            "metadata": {'cart_items': json.dumps(held), 'cart_id': cart_id or "", 'hold_id': hold_id},
+        }, idempotency_key=f"checkout-{hold_id}")
+    except (CircuitOpenError, stripe.error.StripeError) as e:
+        release_holds(StockHold.hold_id == hold_id)
+        db.session.commit()
+        if isinstance(e, CircuitOpenError):
+            flash("El servicio de pagos no está disponible en este momento. Intenta de nuevo en unos minutos.", "error")
+        else:
+            current_app.logger.error("No se pudo crear la sesión de Stripe: %s", e)
+            flash("No pudimos iniciar el pago. Intenta de nuevo.", "error")
+        return redirect(url_for("tienda.view_cart"))
+    finally:
+        invalidate_stock_views()
     return redirect(session_obj.url, code=303)
 
 # ------------------------------
 # Resultados
 # ------------------------------
-@app.route("/success")
+@bp.route("/success")
 def success():
     session_id = request.args.get("session_id")
     return render_template("success.html", session_id=session_id)
 
-@app.route("/cancel")
+@bp.route("/cancel")
 def cancel():
     return render_template("cancel.html")
 
 # ------------------------------
 # Webhook Stripe
 # ------------------------------
-@app.route("/webhook", methods=["POST"])
+class EventLedger:
+    """Registro de eventos de Stripe ya procesados (entrega "al menos una vez").
+
+    Primero se consulta un LRU en memoria con los ids recientes y, si no
+    está ahí, la tabla ``processed_events`` por su llave primaria.
+    """
+
+    def __init__(self, maxsize):
+        self.recent = LRUCache(maxsize)
+        self.duplicates_skipped = 0
+        self._lock = threading.Lock()
+
+    def seen(self, event_id):
+        if event_id in self.recent:
+            return True
+        if db.session.get(ProcessedEvent, event_id) is not None:
+            self.remember(event_id)
+            return True
+        return False
+
+    def remember(self, event_id):
+        self.recent.put(event_id, True)
+
+    def skip(self, event_id):
+        with self._lock:
+            self.duplicates_skipped += 1
+        current_app.logger.info("Evento duplicado ignorado: %s", event_id)
+
+    def stats(self):
+        return {"duplicates_skipped": self.duplicates_skipped, "recent": len(self.recent)}
+
+
+event_ledger = EventLedger(EVENT_LEDGER_LRU_SIZE)
+
+
+def handle_stripe_event(event):
+    """Aplica un evento de Stripe ya verificado (dict) a órdenes y stock.
+
+    La orden, el descuento de stock y la entrada del ledger se confirman en
+    la misma transacción, así que una reentrega del mismo evento no vuelve
+    a descontar stock.
+    """
+    event_id = event.get("id")
+    event_type = event.get("type")
+    current_app.logger.info("Webhook recibido: %s", event_type)
+
+    if event_id and event_ledger.seen(event_id):
+        event_ledger.skip(event_id)
+        return
+
+    unfilled = None
+    stripe_session_id = None
+    cart_items = None
+    released = None
+    try:
+        if event_type == "checkout.session.completed":
+            session_obj = event["data"]["object"]
+            stripe_session_id = session_obj.get("id")
+            order = Order.query.filter_by(stripe_session_id=stripe_session_id).first()
+            if order:
+                order.paid = True
+                order.payload = json.dumps(session_obj)
+                order.amount_total = session_obj.get("amount_total", order.amount_total)
+                order.currency = session_obj.get("currency", order.currency)
+                current_app.logger.info("Orden %s marcada como pagada.", order.id)
+            else:
+                new_order = Order(
+                    stripe_session_id=stripe_session_id,
+                    amount_total=session_obj.get("amount_total", 0),
+                    currency=session_obj.get("currency", "usd"),
+                    paid=True,
+                    payload=json.dumps(session_obj),
+                )
+                db.session.add(new_order)
+                db.session.flush()
+                current_app.logger.info("Orden creada desde webhook: %s", new_order.id)
+            metadata = session_obj.get('metadata') or {}
+            cart_items = metadata.get('cart_items')
+            if metadata.get('hold_id'):
+                # El apartado se vuelve descuento: se libera y el mismo
+                # UPDATE condicional de abajo toma esas unidades
+                release_holds(StockHold.hold_id == metadata['hold_id'])
+        elif event_type == "checkout.session.expired":
+            hold_id = (event["data"]["object"].get("metadata") or {}).get("hold_id")
+            if hold_id:
+                released = release_holds(StockHold.hold_id == hold_id)
+
+        if event_id:
+            db.session.add(ProcessedEvent(event_id=event_id, event_type=event_type))
+
+        # Descontar stock de productos comprados (confirma toda la transacción)
+        if cart_items:
+            unfilled = decrement_stock(json.loads(cart_items))
+        else:
+            db.session.commit()
+    except IntegrityError:
+        # Otro worker registró el mismo evento al mismo tiempo
+        db.session.rollback()
+        event_ledger.remember(event_id)
+        event_ledger.skip(event_id)
+        return
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if event_id:
+        event_ledger.remember(event_id)
+    if released:
+        invalidate_stock_views()
+    if unfilled is not None:
+        invalidate_stock_views()
+        if unfilled:
+            current_app.logger.warning(
+                "Sesión %s: stock insuficiente para %s", stripe_session_id, unfilled
+            )
+        current_app.logger.info("Stock actualizado por compra Stripe.")
+
+
+class WebhookWorkerPool:
+    """Hilos en segundo plano que procesan la bandeja ``webhook_inbox``.
+
+    Un evento se reclama con un ``UPDATE`` condicional y queda "arrendado"
+    durante ``lease`` segundos: si el proceso muere a mitad, otro worker lo
+    vuelve a tomar cuando vence. Los fallos se reintentan con backoff
+    exponencial con jitter hasta ``max_attempts``.
+    """
+
+    def __init__(self, size, max_attempts, poll_interval=1.0, lease=300,
+                 backoff_base=2.0, backoff_cap=600.0):
+        self.app = None  # la asigna init_app (create_app)
+        self.size = size
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.processed = 0
+        self.failed = 0
+        self._next_exhausted_check = 0.0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._pid = None
+
+    def init_app(self, app):
+        self.app = app
+
+    def start(self):
+        with self._lock:
+            # Los hilos no sobreviven a un fork: cada proceso arranca los suyos
+            if self._pid == os.getpid() and all(t.is_alive() for t in self._threads):
+                return
+            self._pid = os.getpid()
+            self._threads = [
+                threading.Thread(target=self._run, name=f"webhook-worker-{i}", daemon=True)
+                for i in range(self.size)
+            ]
+            for t in self._threads:
+                t.start()
+
+    def notify(self):
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    worked = self.run_once()
+            except Exception:
+                self.app.logger.exception("Error en el worker de webhooks")
+                worked = False
+            if not worked:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def fail_exhausted(self, now):
+        """Marca ``failed`` los arriendos vencidos que ya agotaron sus intentos.
+
+        Un worker que muere a mitad no llega a contar el fallo: sin esto el
+        evento se reclamaría para siempre.
+        """
+        result = db.session.execute(
+            update(WebhookEvent)
+            .where(
+                WebhookEvent.status == "processing",
+                WebhookEvent.next_attempt_at <= now,
+                WebhookEvent.attempts >= self.max_attempts,
+            )
+            .values(status="failed", last_error="Arriendo vencido: el worker no terminó el último intento")
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        if result.rowcount:
+            self.failed += result.rowcount
+            self.app.logger.warning("%s webhooks marcados como fallidos tras agotar sus intentos", result.rowcount)
+
+    def claim(self):
+        now = utcnow()
+        # Un arriendo tarda ``lease`` en vencer: no hace falta revisar en cada sondeo
+        if time.monotonic() >= self._next_exhausted_check:
+            self._next_exhausted_check = time.monotonic() + self.lease / 10
+            self.fail_exhausted(now)
+        candidate = (
+            db.session.query(WebhookEvent.id)
+            .filter(
+                WebhookEvent.status.in_(("pending", "processing")),
+                WebhookEvent.next_attempt_at <= now,
+                WebhookEvent.attempts < self.max_attempts,
+            )
+            .order_by(WebhookEvent.next_attempt_at, WebhookEvent.id)
+            .limit(1)
+            .scalar()
+        )
+        if candidate is None:
+            return None
+        result = db.session.execute(
+            update(WebhookEvent)
+            .where(
+                WebhookEvent.id == candidate,
+                WebhookEvent.status.in_(("pending", "processing")),
+                WebhookEvent.next_attempt_at <= now,
+                WebhookEvent.attempts < self.max_attempts,
+            )
+            .values(
+                status="processing",
+                attempts=WebhookEvent.attempts + 1,
+                next_attempt_at=now + timedelta(seconds=self.lease),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        if result.rowcount == 0:
+            return None  # otro worker lo tomó primero
+        return db.session.get(WebhookEvent, candidate)
+
+    def run_once(self):
+        """Procesa un evento de la bandeja. Devuelve False si no había trabajo."""
+        job = self.claim()
+        if job is None:
+            return False
+        try:
+            handle_stripe_event(json.loads(job.payload))
+        except Exception as e:
+            db.session.rollback()
+            self.app.logger.exception("Webhook %s falló (intento %s)", job.id, job.attempts)
+            job.last_error = repr(e)
+            if job.attempts >= self.max_attempts:
+                job.status = "failed"
+                self.failed += 1
+            else:
+                delay = min(self.backoff_base ** job.attempts, self.backoff_cap)
+                job.status = "pending"
+                job.next_attempt_at = utcnow() + timedelta(seconds=delay * random.uniform(0.5, 1.5))
+        else:
+            job.status = "done"
+            job.processed_at = utcnow()
+            self.processed += 1
+        db.session.commit()
+        return True
+
+    def stats(self):
+        counts = dict(
+            db.session.query(WebhookEvent.status, func.count())
+            .filter(WebhookEvent.status.in_(("pending", "processing", "failed")))
+            .group_by(WebhookEvent.status)
+        )
+        return {
+            "depth": counts.get("pending", 0) + counts.get("processing", 0),
+            "pending": counts.get("pending", 0),
+            "processing": counts.get("processing", 0),
+            "failed": counts.get("failed", 0),
+            "processed": self.processed,
+            "workers_alive": sum(t.is_alive() for t in self._threads),
+        }
+
+
+webhook_workers = WebhookWorkerPool(WEBHOOK_WORKERS, WEBHOOK_MAX_ATTEMPTS)
+
+
+@bp.before_app_request
+def start_webhook_workers():
+    # Arranque perezoso (y tras fork): drena también lo que quedó pendiente
+    if WEBHOOK_MODE == "queue":
+        webhook_workers.start()
+
+
+class HoldSweeper:
+    """Hilo que libera por lotes los apartados vencidos.
+
+    Cubre los checkouts abandonados cuyo ``checkout.session.expired`` no
+    llega (o llega tarde). Cada proceso corre el suyo; ``release_holds``
+    evita liberar dos veces.
+    """
+
+    def __init__(self, interval, batch_size):
+        self.app = None  # la asigna init_app (create_app)
+        self.interval = interval
+        self.batch_size = batch_size
+        self.released = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def init_app(self, app):
+        self.app = app
+
+    def start(self):
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="hold-sweeper", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    # Lotes seguidos mientras haya trabajo; luego esperar
+                    while self.run_once() == self.batch_size:
+                        pass
+            except Exception:
+                self.app.logger.exception("Error liberando apartados vencidos")
+            time.sleep(self.interval)
+
+    def run_once(self):
+        """Libera hasta ``batch_size`` apartados vencidos; devuelve cuántos."""
+        expired = (
+            select(StockHold.id)
+            .where(StockHold.expires_at <= utcnow())
+            .order_by(StockHold.expires_at)
+            .limit(self.batch_size)
+        )
+        ids = db.session.execute(expired).scalars().all()
+        if not ids:
+            return 0
+        try:
+            release_holds(StockHold.id.in_(ids))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        invalidate_stock_views()
+        self.released += len(ids)
+        return len(ids)
+
+    def stats(self):
+        active = db.session.query(func.count(StockHold.id), func.sum(StockHold.quantity)).filter(
+            StockHold.expires_at > utcnow()
+        ).one()
+        return {
+            "active_holds": active[0],
+            "units_held": active[1] or 0,
+            "released_by_sweeper": self.released,
+            "sweeper_alive": bool(self._thread and self._thread.is_alive()),
+        }
+
+
+hold_sweeper = HoldSweeper(HOLD_SWEEP_INTERVAL, HOLD_SWEEP_BATCH)
+
+
+@bp.before_app_request
+def start_hold_sweeper():
+    hold_sweeper.start()
+
+
+def enqueue_webhook_event(payload, event):
+    event_id = event.get("id")
+    if event_id and event_ledger.seen(event_id):
+        event_ledger.skip(event_id)
+        return
+    db.session.add(WebhookEvent(
+        event_id=event.get("id"),
+        event_type=event.get("type"),
+        payload=payload.decode("utf-8"),
+    ))
+    db.session.commit()
+    webhook_workers.start()
+    webhook_workers.notify()
+
+
+@bp.route("/webhook", methods=["POST"])
 def webhook_received():
     payload = request.data
     sig_header = request.headers.get("stripe-signature")
@@ -280,73 +1791,60 @@ def webhook_received():
 
     if STRIPE_WEBHOOK_SECRET:
         try:
-            event = stripe.Webhook.construct_event(
+            stripe.Webhook.construct_event(
                 payload=payload, sig_header=sig_header, secret=STRIPE_WEBHOOK_SECRET
             )
+            event = json.loads(payload)
         except ValueError as e:
-            app.logger.error("Invalid payload: %s", e)
+            current_app.logger.error("Invalid payload: %s", e)
             return jsonify({"error": "Invalid payload"}), 400
         except stripe.error.SignatureVerificationError as e:
-            app.logger.error("Invalid signature: %s", e)
+            current_app.logger.error("Invalid signature: %s", e)
             return jsonify({"error": "Invalid signature"}), 400
     else:
         try:
             event = json.loads(payload)
         except Exception as e:
-            app.logger.error("No se pudo parsear el payload: %s", e)
+            current_app.logger.error("No se pudo parsear el payload: %s", e)
             return jsonify({"error": "Invalid payload"}), 400
 
-    event_type = event.get("type")
-    app.logger.info("Webhook recibido: %s", event_type)
-
-    if event_type == "checkout.session.completed":
-        session_obj = event["data"]["object"]
-        stripe_session_id = session_obj.get("id")
-        order = Order.query.filter_by(stripe_session_id=stripe_session_id).first()
-        if order:
-            order.paid = True
-            order.payload = json.dumps(session_obj)
-            order.amount_total = session_obj.get("amount_total", order.amount_total)
-            order.currency = session_obj.get("currency", order.currency)
-            db.session.commit()
-            app.logger.info("Orden %s marcada como pagada.", order.id)
-        else:
-            new_order = Order(
-                stripe_session_id=stripe_session_id,
-                amount_total=session_obj.get("amount_total", 0),
-                currency=session_obj.get("currency", "usd"),
-                paid=True,
-                payload=json.dumps(session_obj),
-            )
-            db.session.add(new_order)
-            db.session.commit()
-            app.logger.info("Orden creada desde webhook: %s", new_order.id)
-
-        # Descontar stock de productos comprados
-        cart_items = session_obj.get('metadata', {}).get('cart_items')
-        if cart_items:
-            cart = json.loads(cart_items)
-            for pid, qty in cart.items():
-                product = Product.query.get(int(pid))
-                if product:
-                    product.stock = max(product.stock - int(qty), 0)
-            db.session.commit()
-            app.logger.info("Stock actualizado por compra Stripe.")
+    if WEBHOOK_MODE == "queue":
+        # Solo se guarda el evento; los workers lo procesan después
+        enqueue_webhook_event(payload, event)
+    else:
+        handle_stripe_event(event)
 
-        # Limpiar carrito del comprador (sesión actual)
-        clear_cart()
+    if event.get("type") == "checkout.session.completed":
+        # Esta petición viene de Stripe, no del navegador: el carrito del
+        # comprador se ubica por el id guardado en la metadata del checkout
+        cart_id = (event["data"]["object"].get("metadata") or {}).get("cart_id")
+        if cart_id:
+            cart_store.delete(cart_id)
 
     return jsonify({"received": True}), 200
 
 # ------------------------------
 # Admin simple (sin auth)
 # ------------------------------
-@app.route("/admin")
+@bp.route("/admin")
 def admin_index():
-    products = Product.query.all()
-    return render_template("admin/index.html", products=products)
+    query = listing_query(Product.id, Product.supplier, Product.name, Product.price_cents)
+    after = decode_cursor(request.args.get("despues", ""))
+    # Un cursor con otros tipos (manipulado) se ignora: vuelve a la primera página
+    if (isinstance(after, list) and len(after) == 2
+            and isinstance(after[0], str) and isinstance(after[1], int)):
+        # Keyset sobre (supplier, id): no depende de cuántas filas se saltan
+        query = query.filter(tuple_(Product.supplier, Product.id) > tuple_(*after))
+    products = query.limit(ADMIN_PAGE_SIZE + 1).all()
+    products, last_id = paginate(products, ADMIN_PAGE_SIZE)
+    cursor = encode_cursor(products[-1].supplier, last_id) if last_id else None
+    if request.headers.get("X-Requested-With") == "XMLHttpRequest":
+        response = make_response(render_template("adm/_filas.html", products=products))
+        response.headers["X-Next-Cursor"] = cursor or ""
+        return response
+    return render_template("adm/index.html", products=products, next_cursor=cursor)
 
-@app.route("/admin/product/new", methods=["GET", "POST"])
+@bp.route("/admin/product/new", methods=["GET", "POST"])
 def admin_new_product():
     if request.method == "POST":
         name = request.form.get("name")
@@ -362,23 +1860,71 @@ def admin_new_product():
             image=image
         )
         db.session.add(p)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            flash(f"Ya existe un producto {name!r} de {supplier}.", "error")
+            return render_template("adm/new.producto.html")
+        catalog_cache.invalidate()
+        api_catalog_cache.invalidate()
         flash("Producto creado", "success")
-        return redirect(url_for("admin_index"))
-    return render_template("admin/new_product.html")
+        return redirect(url_for("tienda.admin_index"))
+    return render_template("adm/new.producto.html")
+
+
+@bp.route("/admin/cache")
+def admin_cache_stats():
+    return jsonify(catalog=catalog_cache.stats(), api=api_catalog_cache.stats())
+
+
+@bp.route("/admin/webhooks")
+def admin_webhook_stats():
+    return jsonify(mode=WEBHOOK_MODE, **webhook_workers.stats(), **event_ledger.stats())
+
+
+@bp.route("/admin/stripe")
+def admin_stripe_stats():
+    if not get_stripe_gateway.cache_info().currsize:
+        return jsonify(initialized=False)  # no crear el cliente solo para consultarlo
+    return jsonify(stripe_gateway.stats())
+
+
+@bp.route("/admin/mail")
+def admin_mail_stats():
+    return jsonify(mail_queue.stats())
 
+@bp.route("/admin/carts")
+def admin_cart_stats():
+    return jsonify(cart_store.stats())
 
-@app.route("/contacto")
+@bp.route("/admin/holds")
+def admin_hold_stats():
+    return jsonify(hold_sweeper.stats())
+
+@bp.route("/admin/queries")
+def admin_query_stats():
+    return jsonify(enabled=QUERY_PROFILER, **query_profiler.stats())
+
+@bp.route("/metrics")
+def metrics_endpoint():
+    expected = f"Bearer {METRICS_TOKEN}"
+    if METRICS_TOKEN and not secrets.compare_digest(request.headers.get("Authorization", ""), expected):
+        return "No autorizado", 401, {"WWW-Authenticate": "Bearer"}
+    return current_app.response_class(
+        metrics_registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@bp.route("/contacto")
 def contacto():
     return render_template("contacto.html", now=datetime.now())
 
-@app.route("/consultar-pedido", methods=["POST"])
+@bp.route("/consultar-pedido", methods=["POST"])
 def consultar_pedido():
     email = request.form.get("email")
     pedido = request.form.get("pedido")
-    # Configura tu email y contraseña (usa variables de entorno en producción)
-    remitente = "tu_email@gmail.com"
-    password = "tu_contraseña"
+    remitente = MAIL_FROM
     destinatario = email
     asunto = "Consulta de pedido"
     mensaje = f"Hola, recibimos tu consulta sobre el pedido #{pedido}. Pronto te contactaremos con la información."
@@ -389,18 +1935,40 @@ def consultar_pedido():
     msg["From"] = remitente
     msg["To"] = destinatario
 
-    try:
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as smtp:
-            smtp.login(remitente, password)
-            smtp.send_message(msg)
-        flash("Consulta enviada correctamente. Revisa tu correo.", "success")
-    except Exception as e:
-        flash(f"Error al enviar el correo: {e}", "error")
-    return redirect(url_for("contacto"))
+    # El envío lo hace el hilo de mail_queue; aquí solo se encola
+    mail_queue.enqueue(msg)
+    flash("Consulta enviada correctamente. Revisa tu correo.", "success")
+    return redirect(url_for("tienda.contacto"))
+
+# ------------------------------
+# Fábrica de la aplicación
+# ------------------------------
+def create_app(config=None):
+    """Crea la aplicación con sus rutas, métricas y hooks.
+
+    No conecta a la BD ni a servicios externos: con ``preload_app`` el
+    master de gunicorn la crea una vez y los workers la heredan tras el
+    fork (ver gunicorn.conf.py).
+    """
+    app = Flask(__name__, template_folder="templates", static_folder="static")
+    app.config["SECRET_KEY"] = SECRET_KEY
+    app.config.update(config or {})
+    configure_db(app)
+    app.register_blueprint(bp)
+    app.get_send_file_max_age = static_max_age
+    before_render_template.connect(template_started, app)
+    template_rendered.connect(template_finished, app)
+    app.wsgi_app = metrics.MetricsMiddleware(app.wsgi_app, finish_request_metrics)
+    if QUERY_PROFILER:
+        query_profiler.init_app(app)
+    webhook_workers.init_app(app)
+    hold_sweeper.init_app(app)
+    return app
 
 # ------------------------------
 # Main
 # ------------------------------
 if __name__ == "__main__":
-    init_db()
+    app = create_app()
+    init_db(app)
     app.run(port=4242, debug=True)
@@ -0,0 +1,365 @@
+"""Benchmark por ruta con un stub local de Stripe.
+
+Arma una BD temporal con un catálogo fijo, levanta stripe_stub.py y mide
+cada escenario con el test client de Flask y/o con un servidor WSGI real
+(werkzeug, con hilos). Reporta peticiones/s, latencia p50/p95/p99 y
+consultas SQL por petición (estas solo en modo client, donde son exactas).
+
+Uso:
+    python benchmark.py [--mode client|server|both] [--requests 200]
+    python benchmark.py --save-baseline benchmark_baseline.json
+    python benchmark.py --compare benchmark_baseline.json --tolerance 0.25
+
+Con --compare sale con código 1 si alguna ruta sube su p95 más de la
+tolerancia o hace más consultas que en la línea base. La línea base solo
+es comparable con el mismo --products y --cart-items, y las latencias solo
+en la misma máquina: guárdala en el runner de CI, no en un portátil.
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+WEBHOOK_SECRET = "whsec_benchmark"
+
+
+def configure_environment(workdir, stub_url):
+    """Variables que app.py lee al importarse: BD temporal, stub y sin ruido de fondo."""
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{Path(workdir) / 'benchmark.db'}",
+        "STRIPE_SECRET_KEY": "sk_test_benchmark",
+        "STRIPE_API_BASE": stub_url,
+        "STRIPE_WEBHOOK_SECRET": WEBHOOK_SECRET,
+        "WEBHOOK_MODE": "inline",
+        "CART_STORE": "memory",
+        "HOLD_SWEEP_INTERVAL": "3600",
+        "FACET_REFRESH_INTERVAL": "3600",
+    })
+
+
+def write_catalog(path, products, seed):
+    rng = random.Random(seed)
+    suppliers = ["bimbo", "gamesa", "sabritas", "barcel", "la_costena"]
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(products):
+            supplier = suppliers[i % len(suppliers)]
+            f.write(json.dumps({
+                "supplier": supplier,
+                "name": f"Producto {i:06d}",
+                "description": "Producto de prueba para el benchmark.",
+                "price_cents": rng.randint(500, 9000),
+                "image": f"producto_{i}.jpg",
+                "brand": supplier.title(),
+                "weight": f"{rng.choice((62, 120, 250, 680))}g",
+                "allergens": rng.choice(("Gluten", "Leche, soya", "")),
+                "stock": 10 ** 9,  # el benchmark descuenta stock en cada webhook
+            }) + "\n")
+
+
+def sign_webhook(payload):
+    timestamp = int(time.time())
+    signature = hmac.new(
+        WEBHOOK_SECRET.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256
+    ).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+class QueryCounter:
+    """Cuenta las consultas SQL hechas por el hilo actual."""
+
+    def __init__(self):
+        self.counts = {}
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        ident = threading.get_ident()
+        self.counts[ident] = self.counts.get(ident, 0) + 1
+
+    def current(self):
+        return self.counts.get(threading.get_ident(), 0)
+
+
+def percentile(sorted_values, pct):
+    # Rango más cercano: sin interpolación, estable con pocas muestras
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed, queries=None):
+    latencies = sorted(latencies)
+    result = {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+    if queries is not None:
+        result["queries"] = round(queries / len(latencies), 2)
+    return result
+
+
+class Scenarios:
+    """Una petición por escenario, igual en test client y en HTTP real.
+
+    ``http`` es un adaptador con ``get``/``post`` que devuelve el código de
+    estado; el carrito de cada cliente se llena con ``cart_items`` productos.
+    """
+
+    def __init__(self, product_ids, cart_items, seed):
+        self.product_ids = product_ids
+        self.cart_items = cart_items
+        self.rng = random.Random(seed)
+        self.event_seq = 0
+        self._lock = threading.Lock()
+
+    def names(self):
+        return [
+            "index", "producto_detalle", "route_add_to_cart", "route_update_cart_ajax",
+            "route_update_cart_form", "create_checkout_session", "webhook_received",
+        ]
+
+    def fill_cart(self, http):
+        ops = [{"op": "set", "product_id": pid, "quantity": 1}
+               for pid in self.product_ids[:self.cart_items]]
+        http.post("/carrito/lote", json={"ops": ops})
+
+    def run(self, name, http):
+        pid = self.rng.choice(self.product_ids[:self.cart_items])
+        if name == "index":
+            return http.get("/")
+        if name == "producto_detalle":
+            return http.get(f"/producto/{self.rng.choice(self.product_ids)}")
+        if name == "route_add_to_cart":
+            return http.post("/add-to-cart", data={"product_id": pid, "cantidad": 1})
+        if name == "route_update_cart_ajax":
+            return http.post("/update-cart", json={"product_id": pid, "quantity": self.rng.randint(1, 5)},
+                             headers={"X-Requested-With": "XMLHttpRequest"})
+        if name == "route_update_cart_form":
+            return http.post("/update-cart", data={f"quantity[{pid}]": self.rng.randint(1, 5)})
+        if name == "create_checkout_session":
+            return http.post("/create-checkout-session")
+        if name == "webhook_received":
+            with self._lock:
+                self.event_seq += 1
+                seq = self.event_seq
+            cart = {pid: 1 for pid in self.product_ids[:self.cart_items]}
+            payload = json.dumps({
+                "id": f"evt_bench_{os.getpid()}_{seq}",
+                "type": "checkout.session.completed",
+                "data": {"object": {
+                    "id": f"cs_bench_{os.getpid()}_{seq}",
+                    "amount_total": 1000,
+                    "currency": "usd",
+                    "metadata": {"cart_items": json.dumps(cart)},
+                }},
+            }).encode("utf-8")
+            return http.post("/webhook", data=payload,
+                             headers={"Content-Type": "application/json",
+                                      "Stripe-Signature": sign_webhook(payload)})
+        raise ValueError(name)
+
+
+class TestClientHTTP:
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, path, **kwargs):
+        return self.client.get(path, **kwargs).status_code
+
+    def post(self, path, **kwargs):
+        return self.client.post(path, **kwargs).status_code
+
+
+class RequestsHTTP:
+    def __init__(self, base_url):
+        import requests
+
+        self.base_url = base_url
+        self.session = requests.Session()
+
+    def get(self, path, **kwargs):
+        return self.session.get(self.base_url + path, allow_redirects=False, **kwargs).status_code
+
+    def post(self, path, **kwargs):
+        return self.session.post(self.base_url + path, allow_redirects=False, **kwargs).status_code
+
+
+def check_status(name, status):
+    if status >= 400:
+        raise RuntimeError(f"{name}: respuesta {status}")
+
+
+def bench_client(app, scenarios, counter, n, warmup):
+    results = {}
+    for name in scenarios.names():
+        http = TestClientHTTP(app.test_client())
+        scenarios.fill_cart(http)
+        for _ in range(warmup):
+            check_status(name, scenarios.run(name, http))
+        latencies = []
+        queries_before = counter.current()
+        started = time.perf_counter()
+        for _ in range(n):
+            t0 = time.perf_counter()
+            check_status(name, scenarios.run(name, http))
+            latencies.append(time.perf_counter() - t0)
+        elapsed = time.perf_counter() - started
+        results[name] = summarize(latencies, elapsed, counter.current() - queries_before)
+    return results
+
+
+def bench_server(app, scenarios, n, warmup, concurrency):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    results = {}
+    try:
+        for name in scenarios.names():
+            clients = [RequestsHTTP(base_url) for _ in range(concurrency)]
+            for http in clients:
+                scenarios.fill_cart(http)
+                for _ in range(max(1, warmup // concurrency)):
+                    check_status(name, scenarios.run(name, http))
+            latencies = []
+            errors = []
+            per_client = max(1, n // concurrency)
+
+            def worker(http):
+                try:
+                    for _ in range(per_client):
+                        t0 = time.perf_counter()
+                        check_status(name, scenarios.run(name, http))
+                        latencies.append(time.perf_counter() - t0)
+                except Exception as e:
+                    errors.append(e)
+
+            threads = [threading.Thread(target=worker, args=(http,)) for http in clients]
+            started = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - started
+            if errors:
+                raise errors[0]
+            results[name] = summarize(latencies, elapsed)
+    finally:
+        server.shutdown()
+    return results
+
+
+def compare(results, baseline, tolerance, min_delta_ms=1.0):
+    """Lista de regresiones respecto a la línea base.
+
+    Una subida de p95 cuenta solo si supera la tolerancia relativa y además
+    ``min_delta_ms``: en rutas de menos de un milisegundo el ruido relativo
+    es grande. Las consultas por petición son exactas y no tienen margen.
+    """
+    regressions = []
+    if baseline.get("config") != results["config"]:
+        return [f"configuración distinta a la línea base: {baseline.get('config')} != {results['config']}"]
+    for mode, routes in results["modes"].items():
+        for name, current in routes.items():
+            base = baseline.get("modes", {}).get(mode, {}).get(name)
+            if not base:
+                continue
+            if (current["p95_ms"] > base["p95_ms"] * (1 + tolerance)
+                    and current["p95_ms"] - base["p95_ms"] > min_delta_ms):
+                regressions.append(
+                    f"{mode}/{name}: p95 {current['p95_ms']:.2f} ms > {base['p95_ms']:.2f} ms (+{tolerance:.0%})"
+                )
+            if "queries" in base and current.get("queries", 0) > base["queries"]:
+                regressions.append(
+                    f"{mode}/{name}: {current['queries']} consultas/petición > {base['queries']}"
+                )
+    return regressions
+
+
+def print_table(mode, routes):
+    print(f"\n[{mode}]")
+    print(f"{'ruta':<26}{'pet/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'consultas':>11}")
+    for name, r in routes.items():
+        queries = f"{r['queries']:.2f}" if "queries" in r else "-"
+        print(f"{name:<26}{r['rps']:>10.1f}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}{queries:>11}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=("client", "server", "both"), default="both")
+    parser.add_argument("--requests", type=int, default=200, help="peticiones medidas por ruta")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4, help="clientes simultáneos en modo server")
+    parser.add_argument("--products", type=int, default=500, help="tamaño fijo del catálogo")
+    parser.add_argument("--cart-items", type=int, default=5, help="productos en el carrito")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--stripe-latency", type=float, default=0.0, help="segundos por llamada al stub")
+    parser.add_argument("--save-baseline", metavar="RUTA")
+    parser.add_argument("--compare", metavar="RUTA")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="aumento de p95 permitido")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="aumento de p95 que se ignora")
+    args = parser.parse_args(argv)
+
+    from stripe_stub import start_stub_server
+
+    stub = start_stub_server(latency=args.stripe_latency)
+    workdir = tempfile.mkdtemp(prefix="tienda-bench-")
+    configure_environment(workdir, stub.url)
+
+    from sqlalchemy import event
+    from app import create_app
+    from models import db, init_db, Product
+    from import_catalog import import_file
+
+    app = create_app()
+    app.logger.setLevel("WARNING")
+    catalog_path = Path(workdir) / "catalogo.jsonl"
+    write_catalog(catalog_path, args.products, args.seed)
+    import_file(catalog_path, out=open(os.devnull, "w"), app=app)
+    init_db(app)
+    with app.app_context():
+        product_ids = [pid for (pid,) in db.session.query(Product.id).order_by(Product.id)]
+        counter = QueryCounter()
+        event.listen(db.engine, "before_cursor_execute", counter)
+
+    scenarios = Scenarios(product_ids, args.cart_items, args.seed)
+    results = {
+        "config": {"products": args.products, "cart_items": args.cart_items},
+        "modes": {},
+    }
+    if args.mode in ("client", "both"):
+        results["modes"]["client"] = bench_client(app, scenarios, counter, args.requests, args.warmup)
+        print_table("test client", results["modes"]["client"])
+    if args.mode in ("server", "both"):
+        results["modes"]["server"] = bench_server(app, scenarios, args.requests, args.warmup, args.concurrency)
+        print_table(f"servidor WSGI, {args.concurrency} clientes", results["modes"]["server"])
+    print(f"\nLlamadas al stub de Stripe: {len(stub.requests)}")
+
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(json.dumps(results, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"Línea base guardada en {args.save_baseline}")
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        for line in regressions:
+            print(f"REGRESIÓN {line}")
+        if regressions:
+            return 1
+        print("Sin regresiones respecto a la línea base.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
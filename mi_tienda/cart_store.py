@@ -0,0 +1,178 @@
+"""Almacenes de carritos del lado del servidor.
+
+La cookie de sesión solo lleva un id opaco; el contenido ({id_producto:
+cantidad}, siempre con enteros) vive aquí. Hay dos backends con la misma
+interfaz (``get``, ``save``, ``delete``, ``purge_expired``, ``stats``):
+
+- ``MemoryCartStore``: dict en el proceso con TTL y desalojo LRU. Sirve con
+  un solo worker.
+- ``SQLiteCartStore``: tabla en un archivo SQLite compartido por todos los
+  workers de la máquina.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def encode_items(cart):
+    """{12: 3, 15: 1} -> "12:3,15:1" (orden por id, sin cantidades <= 0)."""
+    return ",".join(f"{pid}:{qty}" for pid, qty in sorted(cart.items()) if qty > 0)
+
+
+def decode_items(raw):
+    cart = {}
+    for pair in (raw or "").split(","):
+        pid, sep, qty = pair.partition(":")
+        if sep and pid.isdigit() and qty.isdigit() and int(qty) > 0:
+            cart[int(pid)] = int(qty)
+    return cart
+
+
+class MemoryCartStore:
+    def __init__(self, ttl, maxsize=10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.evicted = 0
+        self.expired = 0
+        self._data = OrderedDict()  # cart_id -> (vence_en, items codificados)
+        self._lock = threading.Lock()
+
+    def get(self, cart_id):
+        with self._lock:
+            entry = self._data.get(cart_id)
+            if entry is None:
+                return {}
+            if entry[0] <= time.time():
+                del self._data[cart_id]
+                self.expired += 1
+                return {}
+            self._data.move_to_end(cart_id)
+            return decode_items(entry[1])
+
+    def save(self, cart_id, cart):
+        raw = encode_items(cart)
+        with self._lock:
+            if not raw:
+                self._data.pop(cart_id, None)
+                return
+            self._data[cart_id] = (time.time() + self.ttl, raw)
+            self._data.move_to_end(cart_id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evicted += 1
+
+    def delete(self, cart_id):
+        with self._lock:
+            self._data.pop(cart_id, None)
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            expired = [cart_id for cart_id, (expires_at, _) in self._data.items() if expires_at <= now]
+            for cart_id in expired:
+                del self._data[cart_id]
+            self.expired += len(expired)
+        return len(expired)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "memory",
+                "carts": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "evicted": self.evicted,
+                "expired": self.expired,
+            }
+
+
+class SQLiteCartStore:
+    """Carritos en SQLite; los vencidos se borran cada ``purge_every`` escrituras."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS carts (
+            cart_id TEXT PRIMARY KEY,
+            items TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID
+    """
+
+    def __init__(self, path, ttl, busy_timeout_ms=5000, purge_every=500):
+        self.path = str(path)
+        self.ttl = ttl
+        self.busy_timeout_ms = busy_timeout_ms
+        self.purge_every = purge_every
+        self.expired = 0
+        self._writes = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(self.SCHEMA)
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_carts_expires_at ON carts (expires_at)")
+
+    def _connect(self):
+        # Una conexión por hilo y por proceso (no se comparten tras un fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, cart_id):
+        row = self._connect().execute(
+            "SELECT items FROM carts WHERE cart_id = ? AND expires_at > ?",
+            (cart_id, time.time()),
+        ).fetchone()
+        return decode_items(row[0]) if row else {}
+
+    def save(self, cart_id, cart):
+        raw = encode_items(cart)
+        if not raw:
+            return self.delete(cart_id)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO carts (cart_id, items, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(cart_id) DO UPDATE SET items = excluded.items, expires_at = excluded.expires_at",
+                (cart_id, raw, time.time() + self.ttl),
+            )
+        with self._lock:
+            self._writes += 1
+            purge = self._writes % self.purge_every == 0
+        if purge:
+            self.purge_expired()
+
+    def delete(self, cart_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM carts WHERE cart_id = ?", (cart_id,))
+
+    def purge_expired(self):
+        with self._connect() as conn:
+            deleted = conn.execute("DELETE FROM carts WHERE expires_at <= ?", (time.time(),)).rowcount
+        with self._lock:
+            self.expired += deleted
+        return deleted
+
+    def stats(self):
+        carts = self._connect().execute(
+            "SELECT COUNT(*) FROM carts WHERE expires_at > ?", (time.time(),)
+        ).fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "carts": carts,
+            "ttl": self.ttl,
+            "expired": self.expired,
+        }
+
+
+def create_cart_store(backend, ttl, maxsize=10000, path=None, busy_timeout_ms=5000):
+    if backend == "sqlite":
+        return SQLiteCartStore(path, ttl, busy_timeout_ms=busy_timeout_ms)
+    if backend == "memory":
+        return MemoryCartStore(ttl, maxsize=maxsize)
+    raise ValueError(f"CART_STORE desconocido: {backend!r} (usa memory o sqlite)")
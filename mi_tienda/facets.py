@@ -0,0 +1,202 @@
+"""Índice de facetas en memoria con bitmaps sobre ids de producto.
+
+Cada valor de faceta guarda un entero de Python usado como bitmap (bit
+``id`` encendido si el producto lo tiene). Filtrar es AND/OR de enteros y
+contar es ``bit_count()``, así que combinar varias facetas cuesta
+microsegundos aunque el catálogo sea grande.
+"""
+import re
+import threading
+import unicodedata
+
+# Facetas de selección múltiple (OR dentro de la faceta, AND entre facetas)
+FACETS = ("brand", "supplier", "price", "weight")
+
+PRICE_RANGES = (
+    ("0-2000", 0, 2000, "Hasta $20"),
+    ("2000-3000", 2000, 3000, "$20 a $30"),
+    ("3000-5000", 3000, 5000, "$30 a $50"),
+    ("5000-", 5000, None, "Más de $50"),
+)
+
+WEIGHT_RANGES = (
+    ("0-100", 0, 100, "Hasta 100 g"),
+    ("100-250", 100, 250, "100 a 250 g"),
+    ("250-500", 250, 500, "250 a 500 g"),
+    ("500-", 500, None, "Más de 500 g"),
+)
+WEIGHT_PIECES = ("piezas", "Por piezas")
+
+# Alérgeno -> palabras (sin acentos) que lo delatan en el texto libre.
+# "Puede contener" cuenta como presente: excluir debe ser conservador.
+ALLERGEN_KEYWORDS = {
+    "gluten": ("gluten", "trigo", "cebada", "centeno", "avena"),
+    "huevo": ("huevo", "huevos"),
+    "leche": ("leche", "lacteo", "lacteos", "lactosa", "queso", "mantequilla"),
+    "soya": ("soya", "soja"),
+    "cacahuate": ("cacahuate", "mani"),
+    "nueces": ("nuez", "nueces", "almendra", "avellana"),
+}
+
+
+def _fold(text):
+    text = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def parse_allergens(text):
+    """Extrae los alérgenos conocidos de la columna de texto libre."""
+    words = set(re.findall(r"[a-z]+", _fold(text)))
+    return {
+        allergen for allergen, keywords in ALLERGEN_KEYWORDS.items()
+        if words.intersection(keywords)
+    }
+
+
+def _bucket(value, ranges):
+    for key, low, high, _ in ranges:
+        if value >= low and (high is None or value < high):
+            return key
+    return None
+
+
+def price_bucket(price_cents):
+    return _bucket(price_cents or 0, PRICE_RANGES)
+
+
+def weight_bucket(weight):
+    text = _fold(weight)
+    if WEIGHT_PIECES[0] in text:
+        return WEIGHT_PIECES[0]
+    match = re.search(r"(\d+(?:[.,]\d+)?)\s*(kg|g|ml|l)\b", text)
+    if not match:
+        return None
+    amount = float(match.group(1).replace(",", "."))
+    if match.group(2) in ("kg", "l"):
+        amount *= 1000
+    return _bucket(amount, WEIGHT_RANGES)
+
+
+def facet_values(product):
+    """Valores de faceta de un producto (objeto o fila con esos atributos)."""
+    return {
+        "brand": product.brand or None,
+        "supplier": product.supplier or None,
+        "price": price_bucket(product.price_cents),
+        "weight": weight_bucket(product.weight),
+        "allergen": parse_allergens(product.allergens),
+    }
+
+
+def facet_label(facet, value):
+    if facet == "price":
+        return next(label for key, _, _, label in PRICE_RANGES if key == value)
+    if facet == "weight":
+        if value == WEIGHT_PIECES[0]:
+            return WEIGHT_PIECES[1]
+        return next(label for key, _, _, label in WEIGHT_RANGES if key == value)
+    if facet == "allergen":
+        return f"Sin {value}"
+    return value
+
+
+class FacetIndex:
+    def __init__(self):
+        self.all = 0
+        self.bitmaps = {facet: {} for facet in FACETS + ("allergen",)}
+        self.values = {}  # id -> valores indexados, para poder quitarlos
+        self.generation = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.values)
+
+    def clear(self):
+        with self._lock:
+            self.all = 0
+            self.bitmaps = {facet: {} for facet in FACETS + ("allergen",)}
+            self.values = {}
+            self.generation += 1
+
+    def add(self, product_id, values):
+        with self._lock:
+            self.remove(product_id)
+            bit = 1 << product_id
+            self.all |= bit
+            for facet, value in values.items():
+                for v in (value if isinstance(value, (set, frozenset)) else (value,)):
+                    if v is not None:
+                        bitmaps = self.bitmaps[facet]
+                        bitmaps[v] = bitmaps.get(v, 0) | bit
+            self.values[product_id] = values
+            self.generation += 1
+
+    def remove(self, product_id):
+        with self._lock:
+            values = self.values.pop(product_id, None)
+            if values is None:
+                return
+            mask = ~(1 << product_id)
+            self.all &= mask
+            for facet, value in values.items():
+                for v in (value if isinstance(value, (set, frozenset)) else (value,)):
+                    bitmaps = self.bitmaps[facet]
+                    if v in bitmaps:
+                        bitmaps[v] &= mask
+                        if not bitmaps[v]:
+                            del bitmaps[v]
+            self.generation += 1
+
+    def match(self, filters, skip=None):
+        """Bitmap de los productos que cumplen ``filters``.
+
+        ``filters`` es {faceta: [valores]} más "sin": [alérgenos a excluir].
+        ``skip`` omite una faceta (para contar sus opciones por separado).
+        """
+        with self._lock:
+            result = self.all
+            for facet in FACETS:
+                selected = filters.get(facet)
+                if not selected or facet == skip:
+                    continue
+                union = 0
+                for value in selected:
+                    union |= self.bitmaps[facet].get(value, 0)
+                result &= union
+            if skip != "allergen":
+                for allergen in filters.get("sin", ()):
+                    result &= ~self.bitmaps["allergen"].get(allergen, 0)
+            return result
+
+    def counts(self, filters):
+        """Conteo de cada opción de cada faceta dados los demás filtros."""
+        with self._lock:
+            counts = {}
+            for facet in FACETS:
+                base = self.match(filters, skip=facet)
+                counts[facet] = sorted(
+                    (
+                        (value, facet_label(facet, value), (base & bitmap).bit_count())
+                        for value, bitmap in self.bitmaps[facet].items()
+                    ),
+                    key=lambda item: item[0],
+                )
+            # "Sin X": cuántos quedarían excluyendo además ese alérgeno
+            base = self.match(filters, skip="allergen")
+            excluded = set(filters.get("sin", ()))
+            for allergen in excluded:
+                base &= ~self.bitmaps["allergen"].get(allergen, 0)
+            counts["allergen"] = [
+                (allergen, facet_label("allergen", allergen),
+                 (base & ~self.bitmaps["allergen"].get(allergen, 0)).bit_count())
+                for allergen in sorted(ALLERGEN_KEYWORDS)
+                if allergen in self.bitmaps["allergen"] or allergen in excluded
+            ]
+            return counts
+
+    @staticmethod
+    def ids(bitmap):
+        """Ids encendidos en un bitmap, en orden ascendente."""
+        # bin() y finditer recorren en C: lineal en el tamaño del bitmap
+        bits = bin(bitmap)[:1:-1]
+        return [m.start() for m in re.finditer("1", bits)]
@@ -0,0 +1,231 @@
+"""Genera un catálogo y un historial de pedidos sintéticos para pruebas de escala.
+
+Todo sale de un generador con semilla: la misma semilla y escala producen
+exactamente los mismos datos. Por defecto escribe en ``synthetic.db`` para
+no tocar database.db; la tienda se arranca contra ella con
+``DATABASE_URL=sqlite:///synthetic.db``.
+
+Uso:
+    python generate_data.py --products 100000 --orders 1000000 [--seed 42] [--append]
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from models import create_db_app, db, init_db, utcnow
+from import_catalog import OPTIONAL_COLUMNS
+
+BASE_DIR = Path(__file__).resolve().parent
+
+SUPPLIERS = {
+    "bimbo": ("Bimbo", "Marinela", "Tía Rosa", "Wonder"),
+    "gamesa": ("Gamesa", "Cuétara", "Mac'Ma"),
+    "sabritas": ("Sabritas", "Doritos", "Cheetos", "Ruffles", "Tostitos"),
+    "barcel": ("Barcel", "Takis", "Runners", "Hot Nuts"),
+    "la_costena": ("La Costeña", "Clemente Jacques", "Del Fuerte"),
+    "lala": ("Lala", "Nutri", "Boreal"),
+    "jumex": ("Jumex", "Bida", "Frutzzo"),
+    "herdez": ("Herdez", "Doña María", "McCormick"),
+    "nestle": ("Nestlé", "Nescafé", "Carlos V", "Abuelita"),
+    "sigma": ("FUD", "San Rafael", "Chimex"),
+}
+PRODUCT_TYPES = (
+    "Galletas", "Pan", "Papas", "Botana", "Salsa", "Chiles", "Frijoles", "Jugo",
+    "Leche", "Yogurt", "Mayonesa", "Mole", "Café", "Chocolate", "Jamón", "Salchicha",
+    "Cereal", "Pastelitos", "Cacahuates", "Tostadas",
+)
+FLAVORS = (
+    "Clásico", "Original", "Chile y Limón", "Queso", "Vainilla", "Chocolate", "Fresa",
+    "Natural", "Integral", "Picante", "Adobado", "Light", "Mango", "Durazno",
+    "Manzana", "Habanero", "Chipotle", "Nuez", "Canela", "Tamarindo",
+)
+PRESENTATIONS = ("45g", "62g", "90g", "120g", "170g", "250g", "340g", "500g", "680g", "1kg", "1L", "6 piezas")
+ADJECTIVES = ("crujiente", "suave", "tradicional", "casero", "esponjoso", "intenso", "ligero", "dorado")
+OCCASIONS = ("el desayuno", "la lonchera", "compartir", "la botana", "la comida", "cualquier hora")
+INGREDIENTS = (
+    "harina de trigo", "azúcar", "aceite vegetal", "sal", "maíz", "leche", "huevo",
+    "soya", "cacahuate", "chile", "jitomate", "cebolla", "ajo", "vinagre", "cacao",
+)
+ALLERGEN_TEXTS = (
+    "", "Gluten", "Gluten, huevo", "Gluten, leche", "Lácteos", "Puede contener soya.",
+    "Puede contener soya y gluten.", "Contiene cacahuate y trigo.", "Contiene leche y puede contener soya.",
+)
+FIRST_NAMES = ("María", "José", "Guadalupe", "Juan", "Ana", "Luis", "Rosa", "Carlos", "Fernanda", "Miguel")
+LAST_NAMES = ("Hernández", "García", "Martínez", "López", "González", "Pérez", "Rodríguez", "Sánchez")
+
+
+def synthetic_products(rng, count, start=0):
+    """Productos únicos por (supplier, name): el nombre sale de la posición.
+
+    ``start`` es la primera posición; con ``--append`` se sigue donde
+    terminó la carga anterior para no repetir nombres.
+    """
+    suppliers = list(SUPPLIERS)
+    combos = len(PRODUCT_TYPES) * len(FLAVORS)
+    for i in range(start, start + count):
+        kind = PRODUCT_TYPES[i % len(PRODUCT_TYPES)]
+        flavor = FLAVORS[(i // len(PRODUCT_TYPES)) % len(FLAVORS)]
+        line = i // combos
+        supplier = suppliers[rng.randrange(len(suppliers))]
+        brand = rng.choice(SUPPLIERS[supplier])
+        weight = rng.choice(PRESENTATIONS)
+        name = f"{kind} {flavor} {weight}" + (f" Línea {line}" if line else "")
+        yield {
+            "supplier": supplier,
+            "name": name,
+            "description": (
+                f"{kind} {flavor.lower()} {rng.choice(ADJECTIVES)} de {brand}, "
+                f"ideal para {rng.choice(OCCASIONS)}."
+            ),
+            "price_cents": rng.randrange(800, 15000, 50),
+            "image": None,
+            "brand": brand,
+            "weight": weight,
+            "ingredients": ", ".join(rng.sample(INGREDIENTS, rng.randint(3, 7))).capitalize() + ".",
+            "allergens": rng.choice(ALLERGEN_TEXTS),
+            "nutritional_info": f"Energía: {rng.randint(40, 550)}kcal por porción.",
+            "stock": rng.choice((0, rng.randint(1, 10), rng.randint(10, 500))),
+        }
+
+
+def synthetic_orders(rng, count, products, start, days):
+    """Pedidos pagados con el objeto checkout.session tal como llega al webhook."""
+    span = days * 24 * 3600
+    for _ in range(count):
+        created = start + timedelta(seconds=rng.randrange(span))
+        lines = {}
+        for _ in range(rng.choice((1, 1, 2, 3, 4, 6, 10))):
+            pid, price = products[rng.randrange(len(products))]
+            lines[pid] = (lines.get(pid, (0, price))[0] + rng.randint(1, 3), price)
+        amount = sum(qty * price for qty, price in lines.values())
+        session_id = f"cs_test_{rng.getrandbits(96):024x}"
+        customer = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        session_obj = {
+            "id": session_id,
+            "object": "checkout.session",
+            "amount_subtotal": amount,
+            "amount_total": amount,
+            "created": int(created.timestamp()),
+            "currency": "usd",
+            "customer_details": {
+                "email": f"cliente{rng.randrange(count * 2 or 1)}@example.com",
+                "name": customer,
+            },
+            "metadata": {
+                "cart_items": json.dumps({str(pid): qty for pid, (qty, _) in lines.items()}),
+                "cart_id": f"{rng.getrandbits(128):032x}",
+                "hold_id": f"{rng.getrandbits(128):032x}",
+            },
+            "mode": "payment",
+            "payment_intent": f"pi_{rng.getrandbits(96):024x}",
+            "payment_status": "paid",
+            "status": "complete",
+        }
+        yield {
+            "stripe_session_id": session_id,
+            "amount_total": amount,
+            "currency": "usd",
+            "paid": 1,
+            "payload": json.dumps(session_obj, ensure_ascii=False),
+            "event_id": f"evt_{rng.getrandbits(96):024x}",
+            "processed_at": created,
+        }
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--days", type=int, default=365, help="días de historial de pedidos")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--database", default=str(BASE_DIR / "synthetic.db"),
+                        help="archivo SQLite destino (se crea si no existe)")
+    parser.add_argument("--append", action="store_true",
+                        help="agrega a una BD que ya tiene productos o pedidos")
+    args = parser.parse_args(argv)
+
+    app = create_db_app(f"sqlite:///{Path(args.database).resolve()}")
+    init_db(app)
+    # Fecha fija: la semilla reproduce también las fechas de los pedidos
+    start = datetime(2024, 1, 1)
+    columns = ("supplier", "name", "price_cents", "stock") + OPTIONAL_COLUMNS
+    insert_product = (
+        f"INSERT INTO products ({', '.join(columns)}, reserved, version, updated_at) "
+        f"VALUES ({', '.join(':' + c for c in columns)}, 0, 1, :now) "
+        "ON CONFLICT (supplier, name) DO NOTHING"
+    )
+    insert_order = (
+        "INSERT INTO orders (stripe_session_id, amount_total, currency, paid, payload) "
+        "VALUES (:stripe_session_id, :amount_total, :currency, :paid, :payload) "
+        "ON CONFLICT (stripe_session_id) DO NOTHING"
+    )
+    insert_event = (
+        "INSERT INTO processed_events (event_id, event_type, processed_at) "
+        "VALUES (:event_id, 'checkout.session.completed', :processed_at) "
+        "ON CONFLICT (event_id) DO NOTHING"
+    )
+
+    with app.app_context():
+        conn = db.session.connection()
+        existing_products, existing_orders = conn.exec_driver_sql(
+            "SELECT (SELECT COUNT(*) FROM products), (SELECT COUNT(*) FROM orders)"
+        ).one()
+        if (existing_products or existing_orders) and not args.append:
+            print(f"{args.database} ya tiene datos; usa --append o otro --database", file=sys.stderr)
+            return 1
+        # Con --append la misma semilla repetiría nombres e ids (y ON CONFLICT
+        # no insertaría nada): la secuencia sigue desde lo que ya hay
+        if existing_products or existing_orders:
+            rng = random.Random(f"{args.seed}:{existing_products}:{existing_orders}")
+        else:
+            rng = random.Random(args.seed)
+        # Carga masiva: sin fsync por transacción (la BD es desechable)
+        conn.exec_driver_sql("PRAGMA synchronous=OFF")
+
+        started = time.perf_counter()
+        now = utcnow()
+        inserted = 0
+        for batch in batched(synthetic_products(rng, args.products, existing_products), args.batch_size):
+            for row in batch:
+                row["now"] = now
+            inserted += max(conn.exec_driver_sql(insert_product, batch).rowcount, 0)
+            db.session.commit()
+            conn = db.session.connection()
+        elapsed = time.perf_counter() - started
+        print(f"Productos: {inserted} nuevos de {args.products} en {elapsed:.1f}s ({inserted / elapsed:,.0f}/s)")
+
+        # Los pedidos referencian ids reales (también los de un --append)
+        products = [tuple(row) for row in conn.exec_driver_sql("SELECT id, price_cents FROM products")]
+        started = time.perf_counter()
+        if args.orders and products:
+            inserted = 0
+            for batch in batched(synthetic_orders(rng, args.orders, products, start, args.days), args.batch_size):
+                inserted += max(conn.exec_driver_sql(insert_order, batch).rowcount, 0)
+                conn.exec_driver_sql(insert_event, batch)
+                db.session.commit()
+                conn = db.session.connection()
+            elapsed = time.perf_counter() - started
+            print(f"Pedidos: {inserted} nuevos de {args.orders} en {elapsed:.1f}s ({inserted / elapsed:,.0f}/s)")
+        db.session.commit()
+    print(f"Listo: {args.database}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,45 @@
+"""Configuración de gunicorn para la tienda.
+
+Uso:
+    gunicorn -c gunicorn.conf.py
+
+Con ``preload_app`` el master importa la aplicación una sola vez y los
+workers la heredan con el fork: arrancan rápido y comparten memoria
+(copy-on-write) en lugar de importar cada uno Flask, SQLAlchemy y las
+plantillas. Lo que no sobrevive a un fork se rehace en cada worker: las
+conexiones a la BD (``post_fork``) y los hilos de fondo (arrancan en la
+primera petición).
+
+Con varios workers el carrito va en SQLite (``CART_STORE=sqlite`` por
+defecto): el de memoria es de un solo proceso y cada petición podría caer
+en otro worker. ``CART_STORE=memory`` solo se acepta con un worker.
+"""
+import gc
+import os
+
+wsgi_app = "wsgi:app"
+bind = os.getenv("BIND", "127.0.0.1:4242")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+# Se lee antes de que el master importe la app (preload_app)
+if workers > 1 and os.environ.setdefault("CART_STORE", "sqlite") == "memory":
+    raise RuntimeError("CART_STORE=memory no sirve con varios workers: usa sqlite o WEB_CONCURRENCY=1")
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+# Reinicia workers de a poco para acotar fugas de memoria
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "5000"))
+max_requests_jitter = max_requests // 10
+
+
+def when_ready(server):
+    # Lo importado por el master ya no lo recorre el GC: los workers no
+    # tocan esas páginas (el conteo de referencias del GC las copiaría)
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from models import dispose_engines
+    from wsgi import app  # ya importado en el master: no cuesta nada
+
+    dispose_engines(app)
@@ -0,0 +1,154 @@
+"""Derivados de las imágenes de producto: tamaños reducidos en JPEG y WebP.
+
+Cada imagen de ``static/img/<supplier>/`` se redimensiona a ``WIDTHS`` y se
+guarda en ``static/img/derivados/`` con la huella del contenido en el
+nombre (se pueden cachear para siempre). ``manifest.json`` mapea
+"supplier/imagen" a sus variantes; las imágenes que no existen apuntan ya
+resueltas a las variantes de ``no_imagen.jpg``.
+
+Paso de build (recorre los productos de la BD):
+    python images.py
+Lo que no esté en el manifiesto se sirve con la imagen original hasta el
+siguiente build: las peticiones nunca generan derivados ni reescriben el
+manifiesto, así que su ``version`` es la del archivo que se cargó.
+"""
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+WIDTHS = (120, 240, 480, 800)
+FALLBACK_IMAGE = "no_imagen.jpg"
+OUTPUT_DIR = "derivados"
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+
+
+class ImageManifest:
+    """Manifiesto de derivados; ``build_all`` lo genera y ``resolve`` solo lo lee."""
+
+    def __init__(self, static_dir, widths=WIDTHS):
+        self.static_dir = Path(static_dir)
+        self.img_dir = self.static_dir / "img"
+        self.out_dir = self.img_dir / OUTPUT_DIR
+        self.path = self.out_dir / "manifest.json"
+        self.widths = widths
+        self.entries = {}
+        self.missing = {}  # "supplier/imagen" fuera del manifiesto -> entrada sin variantes
+        self.version = "0"
+        self.generated = 0
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            self.entries = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            self.entries = {}
+        self.missing = {}
+        self._update_version()
+
+    def save(self):
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(self.entries, sort_keys=True, indent=1), encoding="utf-8")
+        os.replace(tmp, self.path)  # atómico: otro worker nunca lee uno a medias
+
+    def _update_version(self):
+        # Cambia cuando cambia el manifiesto; forma parte del ETag de las páginas.
+        # Solo se calcula al cargar y tras build_all, nunca a media petición
+        raw = json.dumps(self.entries, sort_keys=True).encode("utf-8")
+        self.version = hashlib.sha1(raw).hexdigest()[:8]
+
+    def resolve(self, supplier, image):
+        """Entrada del manifiesto para la imagen de un producto."""
+        key = f"{supplier}/{image}" if supplier and image else FALLBACK_IMAGE
+        entry = self.entries.get(key) or self.missing.get(key)
+        if entry is None:
+            entry = self.missing[key] = self._unbuilt(key)
+        return entry
+
+    def _unbuilt(self, key):
+        """Entrada para una imagen sin derivados: la original o el respaldo."""
+        if (self.img_dir / key).is_file():
+            return {"src": f"img/{key}", "jpeg": [], "webp": []}
+        return self.entries.get(FALLBACK_IMAGE) or {"src": f"img/{FALLBACK_IMAGE}", "jpeg": [], "webp": []}
+
+    def _build(self, key):
+        """Genera (si hace falta) las variantes de ``key``; requiere el lock."""
+        source = self.img_dir / key
+        if not source.is_file():
+            entry = self.entries.get(FALLBACK_IMAGE) or self._build(FALLBACK_IMAGE)
+        elif Image is None:
+            entry = {"src": f"img/{key}", "jpeg": [], "webp": []}
+        else:
+            entry = self._render(key, source)
+        self.entries[key] = entry
+        return entry
+
+    def _render(self, key, source):
+        data = source.read_bytes()
+        digest = hashlib.sha1(data).hexdigest()[:10]
+        stem = Path(key).with_suffix("")
+        entry = {"jpeg": [], "webp": []}
+        with Image.open(source) as original:
+            original = ImageOps.exif_transpose(original)
+            rgb = original.convert("RGB")
+            widths = sorted({min(w, original.width) for w in self.widths})
+            for width in widths:
+                height = max(1, round(original.height * width / original.width))
+                resized = rgb if width == original.width else rgb.resize((width, height), Image.LANCZOS)
+                for fmt, ext, options in (
+                    ("jpeg", "jpg", {"quality": JPEG_QUALITY, "optimize": True, "progressive": True}),
+                    ("webp", "webp", {"quality": WEBP_QUALITY, "method": 4}),
+                ):
+                    relative = f"img/{OUTPUT_DIR}/{stem}.{digest}.{width}w.{ext}"
+                    target = self.static_dir / relative
+                    if not target.exists():  # mismo contenido, mismo nombre
+                        target.parent.mkdir(parents=True, exist_ok=True)
+                        resized.save(target, fmt, **options)
+                        self.generated += 1
+                    entry[fmt].append([width, relative])
+        # La variante más cercana a 240px es el src para navegadores sin srcset
+        entry["src"] = min(entry["jpeg"], key=lambda v: abs(v[0] - 240))[1]
+        return entry
+
+    def build_all(self, images):
+        """Genera las variantes de todas las (supplier, image) dadas."""
+        with self._lock:
+            self._build(FALLBACK_IMAGE)
+            for supplier, image in images:
+                key = f"{supplier}/{image}" if supplier and image else FALLBACK_IMAGE
+                self._build(key)
+            self.missing = {}
+            self._update_version()
+            if Image is not None:
+                self.save()
+        return len(self.entries)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.parse_args()
+    if Image is None:
+        raise SystemExit("Instala Pillow para generar los derivados: pip install Pillow")
+
+    from models import create_db_app, db, Product
+
+    image_manifest = ImageManifest(Path(__file__).resolve().parent / "static")
+    with create_db_app().app_context():
+        images = db.session.query(Product.supplier, Product.image).distinct().all()
+    total = image_manifest.build_all(images)
+    size = sum(p.stat().st_size for p in image_manifest.out_dir.rglob("*") if p.is_file())
+    print(
+        f"{total} imágenes en el manifiesto, {image_manifest.generated} archivos nuevos "
+        f"({size / 1024:.0f} KB en {image_manifest.out_dir})"
+    )
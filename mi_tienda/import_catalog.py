@@ -0,0 +1,192 @@
+"""Importa productos desde CSV o JSONL con upsert por (supplier, name).
+
+Lee el archivo fila por fila (memoria constante, sin importar el tamaño) y
+escribe en bloques con un solo ``INSERT ... ON CONFLICT`` por bloque
+(executemany). Un producto existente solo se reescribe si algo cambió; las
+columnas ausentes en el archivo conservan su valor. Basta con
+``supplier,name,price`` (o ``price_cents``) y ``stock`` para una lista de
+precios de proveedor.
+
+Uso:
+    python import_catalog.py productos.csv [--format csv|jsonl] [--chunk-size 2000] [--insert-only]
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from sqlalchemy import text
+
+from models import create_db_app, db, init_db, utcnow
+
+# Columnas opcionales: si no vienen se conserva lo que ya hay
+OPTIONAL_COLUMNS = (
+    "description", "image", "brand", "weight", "ingredients", "allergens", "nutritional_info",
+)
+
+UPSERT_SQL = """
+    INSERT INTO products (
+        supplier, name, price_cents, stock, reserved, version, updated_at,
+        {columns}
+    )
+    VALUES (
+        :supplier, :name, :price_cents, COALESCE(:stock, 0), 0, 1, :now,
+        {values}
+    )
+    ON CONFLICT (supplier, name) DO {action}
+"""
+
+UPDATE_ACTION = """UPDATE SET
+        price_cents = excluded.price_cents,
+        stock = COALESCE(:stock, products.stock),
+        {updates},
+        version = products.version + 1,
+        updated_at = excluded.updated_at
+    WHERE products.price_cents IS NOT excluded.price_cents
+        OR products.stock IS NOT COALESCE(:stock, products.stock)
+        OR {changed}
+"""
+
+
+def build_upsert(insert_only=False):
+    action = "NOTHING" if insert_only else UPDATE_ACTION.format(
+        updates=",\n        ".join(f"{c} = COALESCE(:{c}, products.{c})" for c in OPTIONAL_COLUMNS),
+        changed="\n        OR ".join(f"products.{c} IS NOT COALESCE(:{c}, products.{c})" for c in OPTIONAL_COLUMNS),
+    )
+    return UPSERT_SQL.format(
+        columns=", ".join(OPTIONAL_COLUMNS),
+        values=", ".join(f":{c}" for c in OPTIONAL_COLUMNS),
+        action=action,
+    )
+
+
+def read_rows(path, fmt):
+    """Pares (línea, fila); en JSONL la fila es el texto sin parsear.
+
+    El JSON se parsea en ``normalize`` para que una línea mal formada se
+    omita como cualquier otra fila inválida.
+    """
+    with open(path, encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for number, line in enumerate(f, 1):
+                line = line.strip()
+                if line:
+                    yield number, line
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _integer(value, field):
+    """Entero exacto: 12.5 o "12.5" no se truncan, se rechaza la fila."""
+    try:
+        number = Decimal(str(value).strip()) if not isinstance(value, bool) else None
+    except InvalidOperation:
+        number = None
+    if number is None or not number.is_finite() or number != number.to_integral_value():
+        raise ValueError(f"{field} no es un entero: {value!r}")
+    return int(number)
+
+
+def normalize(row, now):
+    """Fila del archivo -> parámetros del upsert; ValueError si no sirve."""
+    if isinstance(row, str):
+        try:
+            row = json.loads(row)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"JSON inválido: {e.msg} (columna {e.colno})")
+        if not isinstance(row, dict):
+            raise ValueError("la línea no es un objeto JSON")
+    supplier = (row.get("supplier") or "").strip()
+    name = (row.get("name") or "").strip()
+    if not supplier or not name:
+        raise ValueError("faltan supplier o name")
+    if not _blank(row.get("price_cents")):
+        price_cents = _integer(row["price_cents"], "price_cents")
+    elif not _blank(row.get("price")):
+        try:
+            price_cents = int((Decimal(str(row["price"]).replace(",", "")) * 100).to_integral_value())
+        except InvalidOperation:
+            raise ValueError(f"precio inválido: {row['price']!r}")
+    else:
+        raise ValueError("falta price o price_cents")
+    params = {
+        "supplier": supplier,
+        "name": name,
+        "price_cents": price_cents,
+        "stock": None if _blank(row.get("stock")) else _integer(row["stock"], "stock"),
+        "now": now,
+    }
+    for column in OPTIONAL_COLUMNS:
+        value = row.get(column)
+        params[column] = None if _blank(value) else str(value)
+    return params
+
+
+def import_file(path, fmt=None, chunk_size=2000, insert_only=False, out=sys.stdout, app=None):
+    """Importa ``path`` y devuelve un resumen con conteos y filas por segundo.
+
+    Sin ``app`` usa una app de solo BD (``DATABASE_URL``); la tienda ve los
+    cambios cuando vence el TTL de sus cachés.
+    """
+    app = app or create_db_app()
+    fmt = fmt or ("csv" if str(path).lower().endswith(".csv") else "jsonl")
+    statement = build_upsert(insert_only)
+    summary = {"rows": 0, "written": 0, "inserted": 0, "skipped": 0}
+    started = time.perf_counter()
+    init_db(app)
+    with app.app_context():
+        before = db.session.execute(text("SELECT COUNT(*) FROM products")).scalar()
+        now = utcnow()
+        rows = read_rows(path, fmt)
+        while True:
+            batch = list(islice(rows, chunk_size))
+            if not batch:
+                break
+            chunk = []
+            for line, row in batch:
+                try:
+                    chunk.append(normalize(row, now))
+                except (ValueError, TypeError) as e:
+                    summary["skipped"] += 1
+                    print(f"Línea {line} omitida: {e}", file=out)
+            if not chunk:
+                continue
+            summary["rows"] += len(chunk)
+            # Una transacción por bloque: el WAL no crece sin límite
+            # exec_driver_sql: executemany directo del driver, sin procesar
+            # cada fila en SQLAlchemy
+            result = db.session.connection().exec_driver_sql(statement, chunk)
+            summary["written"] += max(result.rowcount, 0)
+            db.session.commit()
+        after = db.session.execute(text("SELECT COUNT(*) FROM products")).scalar()
+    elapsed = time.perf_counter() - started
+    summary["inserted"] = after - before
+    summary["updated"] = summary["written"] - summary["inserted"]
+    summary["unchanged"] = summary["rows"] - summary["written"]
+    summary["seconds"] = elapsed
+    summary["rows_per_second"] = summary["rows"] / elapsed if elapsed else 0.0
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="archivo .csv o .jsonl")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="por defecto, según la extensión")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="filas por INSERT/transacción")
+    parser.add_argument("--insert-only", action="store_true", help="no modifica productos existentes")
+    args = parser.parse_args()
+    summary = import_file(args.path, args.format, args.chunk_size, args.insert_only)
+    print(
+        "{rows} filas en {seconds:.2f}s ({rows_per_second:,.0f} filas/s): "
+        "nuevas {inserted}, actualizadas {updated}, sin cambios {unchanged}, "
+        "omitidas {skipped}".format(**summary)
+    )
@@ -0,0 +1,146 @@
+"""Cola de correo saliente con un hilo emisor y conexión SMTP reutilizada.
+
+Las vistas solo encolan el mensaje; el hilo mantiene abierta una conexión
+autenticada, envía en lotes y reintenta con backoff los fallos.
+"""
+import heapq
+import itertools
+import logging
+import os
+import queue
+import smtplib
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class MailQueue:
+    def __init__(self, host, port, username=None, password=None, use_ssl=True,
+                 timeout=10.0, batch_size=20, max_attempts=5, retry_base=5.0,
+                 idle_timeout=60.0, observer=None):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.idle_timeout = idle_timeout
+        # observer(servicio, operación, segundos, resultado) por cada envío
+        self.observer = observer
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.connections = 0
+        self._queue = queue.Queue()
+        self._retries = []  # heap (vence_en, seq, intentos, mensaje)
+        self._seq = itertools.count()
+        self._smtp = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def enqueue(self, msg):
+        self._queue.put((msg, 0))
+        self.start()
+
+    def start(self):
+        with self._lock:
+            # Los hilos no sobreviven a un fork: cada proceso arranca el suyo
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._smtp = None
+            self._thread = threading.Thread(target=self._run, name="mail-sender", daemon=True)
+            self._thread.start()
+
+    def _connect(self):
+        if self._smtp is not None:
+            return self._smtp
+        if self.use_ssl:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.username:
+            smtp.login(self.username, self.password)
+        self._smtp = smtp
+        self.connections += 1
+        return smtp
+
+    def _disconnect(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except Exception:
+            pass
+        self._smtp = None
+
+    def _next_batch(self):
+        now = time.monotonic()
+        batch = []
+        while self._retries and self._retries[0][0] <= now and len(batch) < self.batch_size:
+            _, _, attempts, msg = heapq.heappop(self._retries)
+            batch.append((msg, attempts))
+        timeout = self.idle_timeout
+        if self._retries:
+            timeout = max(0.0, min(timeout, self._retries[0][0] - now))
+        if not batch:
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                return batch
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                # Sin trabajo: no mantener la conexión abierta indefinidamente
+                self._disconnect()
+                continue
+            self.send_batch(batch)
+
+    def send_batch(self, batch):
+        for msg, attempts in batch:
+            started = time.perf_counter()
+            try:
+                self._connect().send_message(msg)
+                self.sent += 1
+                self._observe(started, "ok")
+            except Exception as e:  # el hilo emisor nunca debe morir
+                self._observe(started, "error")
+                self._disconnect()
+                self._schedule_retry(msg, attempts + 1, e)
+
+    def _observe(self, started, outcome):
+        if self.observer is not None:
+            self.observer("smtp", "send", time.perf_counter() - started, outcome)
+
+    def _schedule_retry(self, msg, attempts, error):
+        if attempts >= self.max_attempts:
+            self.failed += 1
+            logger.error("Correo a %s descartado tras %s intentos: %s", msg["To"], attempts, error)
+            return
+        self.retried += 1
+        delay = self.retry_base * 2 ** (attempts - 1)
+        logger.warning("Fallo al enviar correo a %s (reintento en %.0fs): %s", msg["To"], delay, error)
+        heapq.heappush(self._retries, (time.monotonic() + delay, next(self._seq), attempts, msg))
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "retrying": len(self._retries),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "connections": self.connections,
+        }
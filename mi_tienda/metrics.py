@@ -0,0 +1,231 @@
+"""Métricas de la tienda en formato de texto de Prometheus.
+
+Contadores e histogramas con buckets fijos: registrar una observación es
+un ``bisect`` y una suma bajo un lock, barato como para dejarlo activo en
+producción. ``RequestTimings`` acumula lo que cuesta cada petición (SQL,
+plantillas, llamadas salientes) en una ``ContextVar``, de donde salen los
+histogramas por endpoint y la cabecera ``Server-Timing``.
+
+Cada proceso lleva sus propias métricas: con varios workers cada uno
+expone las suyas (Prometheus suma por ``instance``/``pid``).
+"""
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+_current = contextvars.ContextVar("request_timings", default=None)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [conteo por bucket (+Inf al final), suma]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            series = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._series.items())
+        for labels, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            base = _labels(self.labelnames, labels)
+            yield f"{self.name}_sum{base} {_number(total)}"
+            yield f"{self.name}_count{base} {cumulative}"
+
+
+class Gauge:
+    """Valor leído al exportar (``fn`` devuelve un número)."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, fn):
+        self.name = name
+        self.help = help
+        self.fn = fn
+
+    def samples(self):
+        yield f"{self.name} {_number(self.fn())}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name, help, fn):
+        return self.register(Gauge(name, help, fn))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+class RequestTimings:
+    """Lo que lleva gastado la petición en curso, por componente."""
+
+    __slots__ = ("started", "endpoint", "sql_count", "sql_seconds", "template_seconds",
+                 "external", "_template_starts")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.endpoint = None
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.external = {}  # servicio -> segundos
+        self._template_starts = []
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        parts = [
+            f"app;dur={self.elapsed() * 1000:.1f}",
+            f'sql;dur={self.sql_seconds * 1000:.1f};desc="{self.sql_count} consultas"',
+        ]
+        if self.template_seconds:
+            parts.append(f"tpl;dur={self.template_seconds * 1000:.1f}")
+        for service, seconds in sorted(self.external.items()):
+            parts.append(f"{service};dur={seconds * 1000:.1f}")
+        return ", ".join(parts)
+
+
+def current_timings():
+    return _current.get()
+
+
+def start_request():
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def record_sql(seconds):
+    timings = _current.get()
+    if timings is not None:
+        timings.sql_count += 1
+        timings.sql_seconds += seconds
+
+
+def template_started():
+    timings = _current.get()
+    if timings is not None:
+        timings._template_starts.append(time.perf_counter())
+
+
+def template_finished():
+    """Segundos que tardó la plantilla (None fuera de una petición)."""
+    timings = _current.get()
+    if timings is None or not timings._template_starts:
+        return None
+    seconds = time.perf_counter() - timings._template_starts.pop()
+    if not timings._template_starts:  # las anidadas ya cuentan dentro de la externa
+        timings.template_seconds += seconds
+    return seconds
+
+
+def record_external(service, seconds):
+    timings = _current.get()
+    if timings is not None:
+        timings.external[service] = timings.external.get(service, 0.0) + seconds
+
+
+class MetricsMiddleware:
+    """Middleware WSGI: abre el ``RequestTimings`` y avisa al terminar.
+
+    ``on_finish(timings, method, status)`` recibe el status real que se
+    envió (500 si la aplicación lanzó una excepción).
+    """
+
+    def __init__(self, wsgi_app, on_finish):
+        self.wsgi_app = wsgi_app
+        self.on_finish = on_finish
+
+    def __call__(self, environ, start_response):
+        timings, token = start_request()
+        status = [500]
+
+        def _start_response(status_line, headers, exc_info=None):
+            status[0] = int(status_line.split(" ", 1)[0])
+            return start_response(status_line, headers, exc_info)
+
+        try:
+            return self.wsgi_app(environ, _start_response)
+        finally:
+            end_request(token)
+            self.on_finish(timings, environ.get("REQUEST_METHOD", ""), status[0])
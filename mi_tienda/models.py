@@ -0,0 +1,293 @@
+"""Modelos, esquema y conexión a la base de datos de la tienda.
+
+No depende de app.py: las herramientas de línea de comandos (populate.py,
+import_catalog.py, generate_data.py...) trabajan con ``create_db_app()``
+sin cargar rutas, Stripe ni correo. La tienda llama a ``configure_db`` desde
+``create_app``.
+"""
+import logging
+import os
+import sqlite3
+from datetime import datetime, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+
+load_dotenv()
+
+BASE_DIR = Path(__file__).resolve().parent
+
+DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{BASE_DIR / 'database.db'}")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "20000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+logger = logging.getLogger(__name__)
+
+db = SQLAlchemy()
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# ------------------------------
+# Conexión
+# ------------------------------
+def configure_db(app, database_url=None):
+    """Asocia ``db`` a ``app``; el engine se crea aquí pero no conecta todavía."""
+    if database_url:
+        app.config["SQLALCHEMY_DATABASE_URI"] = database_url
+    app.config.setdefault("SQLALCHEMY_DATABASE_URI", DATABASE_URL)
+    app.config.setdefault("SQLALCHEMY_TRACK_MODIFICATIONS", False)
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", {"pool_pre_ping": True})
+    db.init_app(app)
+
+
+def create_db_app(database_url=None):
+    """App mínima con solo la BD, para scripts y herramientas."""
+    app = Flask(__name__)
+    configure_db(app, database_url)
+    return app
+
+
+def dispose_engines(app):
+    """Tras un fork: el hijo descarta el pool heredado y abre sus conexiones.
+
+    ``close=False`` no cierra las conexiones del padre (siguen siendo suyas);
+    solo deja de usarlas este proceso.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+@event.listens_for(Engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Perfil de producción para SQLite, aplicado a cada conexión nueva.
+
+    WAL deja que las lecturas sigan mientras el webhook escribe y
+    busy_timeout hace esperar a los escritores en vez de fallar con
+    "database is locked".
+    """
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+# ------------------------------
+# Modelos
+# ------------------------------
+class Product(db.Model):
+    __tablename__ = "products"
+    __table_args__ = (
+        db.Index("ix_products_supplier", "supplier"),
+        # Llave natural: import_catalog.py hace upsert con ON CONFLICT (supplier, name)
+        db.Index("uq_products_supplier_name", "supplier", "name", unique=True),
+        db.Index("ix_products_updated_at", "updated_at"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    supplier = db.Column(db.String(120), nullable=False)
+    name = db.Column(db.String(120), nullable=False)
+    description = db.Column(db.Text, nullable=True)
+    price_cents = db.Column(db.Integer, nullable=False)
+    image = db.Column(db.String(255), nullable=True)
+    brand = db.Column(db.String(120), nullable=True)
+    weight = db.Column(db.String(50), nullable=True)
+    ingredients = db.Column(db.Text, nullable=True)
+    allergens = db.Column(db.Text, nullable=True)
+    nutritional_info = db.Column(db.Text, nullable=True)
+    stock = db.Column(db.Integer, nullable=False, default=0)
+    # Suma de los apartados vigentes (stock_holds); disponible = stock - reserved
+    reserved = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    # Catálogo sincronizado en Stripe (ver sync_stripe_catalog.py)
+    stripe_product_id = db.Column(db.String(255), nullable=True)
+    stripe_price_id = db.Column(db.String(255), nullable=True)
+    stripe_price_cents = db.Column(db.Integer, nullable=True)  # precio del stripe_price_id
+    stripe_synced_hash = db.Column(db.String(64), nullable=True)  # huella de nombre/descr.
+    # Cambian con cada modificación; de aquí salen ETag y Last-Modified
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+    updated_at = db.Column(db.DateTime, nullable=True, default=lambda: utcnow(), onupdate=lambda: utcnow())
+
+    def price_display(self):
+        return f"{self.price_cents / 100:.2f}"
+
+    @property
+    def available_stock(self):
+        return max((self.stock or 0) - (self.reserved or 0), 0)
+
+
+
+# Datos internos de la sincronización con Stripe: no cambian lo que ve el cliente
+STRIPE_SYNC_COLUMNS = frozenset(
+    ("stripe_product_id", "stripe_price_id", "stripe_price_cents", "stripe_synced_hash")
+)
+
+
+@event.listens_for(Product, "before_update")
+def bump_product_version(mapper, connection, target):
+    state = inspect(target)
+    if any(
+        state.attrs[attr.key].history.has_changes()
+        for attr in mapper.column_attrs
+        if attr.key not in STRIPE_SYNC_COLUMNS
+    ):
+        target.version = (target.version or 0) + 1
+
+
+class Order(db.Model):
+    __tablename__ = "orders"
+    id = db.Column(db.Integer, primary_key=True)
+    stripe_session_id = db.Column(db.String(255), nullable=False, unique=True)
+    amount_total = db.Column(db.Integer, nullable=False)  # centavos
+    currency = db.Column(db.String(10), default="usd")
+    paid = db.Column(db.Boolean, default=False)
+    payload = db.Column(db.Text)  # JSON con datos del evento (opcional)
+
+
+class WebhookEvent(db.Model):
+    __tablename__ = "webhook_inbox"
+    __table_args__ = (
+        db.Index("ix_webhook_inbox_status_next", "status", "next_attempt_at"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.String(255))
+    event_type = db.Column(db.String(100))
+    payload = db.Column(db.Text, nullable=False)  # cuerpo crudo tal como llegó
+    status = db.Column(db.String(20), nullable=False, default="pending")  # pending | processing | done | failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=lambda: utcnow())
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: utcnow())
+    processed_at = db.Column(db.DateTime)
+
+
+class StockHold(db.Model):
+    """Unidades apartadas por una sesión de checkout hasta ``expires_at``."""
+    __tablename__ = "stock_holds"
+    __table_args__ = (
+        db.Index("ix_stock_holds_hold_id", "hold_id"),
+        db.Index("ix_stock_holds_cart_id", "cart_id"),
+        db.Index("ix_stock_holds_expires_at", "expires_at"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    hold_id = db.Column(db.String(64), nullable=False)  # uno por checkout (metadata de Stripe)
+    cart_id = db.Column(db.String(64), nullable=True)
+    product_id = db.Column(db.Integer, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: utcnow())
+
+
+class ProcessedEvent(db.Model):
+    __tablename__ = "processed_events"
+    event_id = db.Column(db.String(255), primary_key=True)  # id del evento de Stripe (evt_...)
+    event_type = db.Column(db.String(100))
+    processed_at = db.Column(db.DateTime, nullable=False, default=lambda: utcnow())
+
+# ------------------------------
+# Esquema
+# ------------------------------
+
+# Índices reemplazados por otros; se borran de las BD existentes
+OBSOLETE_INDEXES = ("ix_products_supplier_name",)
+
+
+def ensure_schema():
+    """Crea las tablas nuevas y agrega a las existentes las columnas e índices que falten.
+
+    ``create_all`` no altera tablas ya creadas y el proyecto no usa
+    migraciones, así que las columnas nuevas (siempre opcionales o con
+    default) se agregan con ``ALTER TABLE ... ADD COLUMN``.
+    """
+    db.create_all()
+    inspector = inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(db.engine.dialect)}"
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                conn.execute(text(ddl))
+            # Igual con los índices declarados después de crear la tabla
+            for index in table.indexes:
+                try:
+                    with conn.begin_nested():
+                        index.create(conn, checkfirst=True)
+                except IntegrityError:
+                    # Un índice único no se puede crear si ya hay duplicados
+                    logger.error(
+                        "No se pudo crear %s: hay filas duplicadas en %s", index.name, table.name
+                    )
+        for name in OBSOLETE_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+# Índice FTS5 externo sobre products; los triggers lo mantienen al día.
+# remove_diacritics hace que "panque" encuentre "Panqué" y "costena" a "Costeña".
+SEARCH_INDEX_DDL = (
+    """
+    CREATE VIRTUAL TABLE products_fts USING fts5(
+        name, description, brand, ingredients, allergens,
+        content='products', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, name, description, brand, ingredients, allergens)
+        VALUES (new.id, new.name, new.description, new.brand, new.ingredients, new.allergens);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, description, brand, ingredients, allergens)
+        VALUES ('delete', old.id, old.name, old.description, old.brand, old.ingredients, old.allergens);
+    END
+    """,
+    # Solo las columnas indexadas: descontar stock no toca el índice
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_au
+    AFTER UPDATE OF name, description, brand, ingredients, allergens ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, description, brand, ingredients, allergens)
+        VALUES ('delete', old.id, old.name, old.description, old.brand, old.ingredients, old.allergens);
+        INSERT INTO products_fts(rowid, name, description, brand, ingredients, allergens)
+        VALUES (new.id, new.name, new.description, new.brand, new.ingredients, new.allergens);
+    END
+    """,
+)
+
+
+def ensure_search_index():
+    if db.engine.dialect.name != "sqlite":
+        return
+    with db.engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'")
+        ).first()
+        if not exists:
+            conn.execute(text(SEARCH_INDEX_DDL[0]))
+        for ddl in SEARCH_INDEX_DDL[1:]:
+            conn.execute(text(ddl))
+        if not exists:
+            # Índice nuevo sobre una tabla con datos: se llena una sola vez
+            conn.execute(text("INSERT INTO products_fts(products_fts) VALUES ('rebuild')"))
+
+def init_db(app):
+    with app.app_context():
+        ensure_schema()
+        ensure_search_index()
+
@@ -0,0 +1,195 @@
+"""Detector de N+1 y consultas lentas para desarrollo (opt-in).
+
+Escucha los eventos de ejecución de SQLAlchemy y agrupa las sentencias de
+cada petición por su forma normalizada (literales y listas ``IN (?, ?)``
+colapsados). Una forma que se repite ``repeat_threshold`` veces o más en la
+misma petición se marca como posible N+1; una sentencia que tarda más de
+``slow_ms`` se registra con su ``EXPLAIN QUERY PLAN`` y la ruta de origen.
+
+En la tienda se activa con ``QUERY_PROFILER=1``; ``profile()`` funciona
+siempre, así que una prueba puede usarlo sin la variable:
+
+    with query_profiler.profile("index") as prof:
+        client.get("/")
+    print(prof.report())
+    prof.assert_max_queries(3)
+"""
+import contextvars
+import logging
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from flask import g, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_sql(statement):
+    """Forma de la sentencia: sin literales y con ``IN (?, ?, ?)`` -> ``IN (?)``."""
+    sql = _STRING.sub("?", statement)
+    sql = _NUMBER.sub("?", sql)
+    sql = _PARAM_LIST.sub("(?)", sql)
+    return _SPACES.sub(" ", sql).strip()
+
+
+class QueryProfile:
+    """Las sentencias de una petición (o de un bloque ``profile()``)."""
+
+    def __init__(self, route, repeat_threshold, slow_ms):
+        self.route = route
+        self.repeat_threshold = repeat_threshold
+        self.slow_ms = slow_ms
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = {}  # forma -> [veces, segundos]
+        self.slow = []  # (ms, sentencia, plan)
+
+    def add(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        shape = self.shapes.setdefault(normalize_sql(statement), [0, 0.0])
+        shape[0] += 1
+        shape[1] += seconds
+
+    def repeated(self):
+        """Formas que se repiten al menos ``repeat_threshold`` veces."""
+        return sorted(
+            ((count, shape, seconds) for shape, (count, seconds) in self.shapes.items()
+             if count >= self.repeat_threshold),
+            reverse=True,
+        )
+
+    def report(self):
+        lines = [f"{self.route}: {self.count} consultas, {self.seconds * 1000:.1f} ms"]
+        for count, shape, seconds in self.repeated():
+            lines.append(f"  N+1? {count}x ({seconds * 1000:.1f} ms): {shape}")
+        for ms, statement, plan in self.slow:
+            lines.append(f"  Lenta ({ms:.1f} ms): {_SPACES.sub(' ', statement).strip()}")
+            lines.extend(f"    {row}" for row in plan)
+        return "\n".join(lines)
+
+    def assert_max_queries(self, limit):
+        if self.count > limit:
+            raise AssertionError(f"Se esperaban como máximo {limit} consultas\n{self.report()}")
+
+    def to_dict(self):
+        return {
+            "route": self.route,
+            "queries": self.count,
+            "ms": round(self.seconds * 1000, 2),
+            "repeated": [{"count": c, "shape": s} for c, s, _ in self.repeated()],
+            "slow": [{"ms": round(ms, 2), "sql": sql, "plan": plan} for ms, sql, plan in self.slow],
+        }
+
+
+class QueryProfiler:
+    def __init__(self, target, repeat_threshold=5, slow_ms=100.0, explain=True, keep=50):
+        self.target = target  # un Engine o la clase Engine (todas las conexiones)
+        self.repeat_threshold = repeat_threshold
+        self.slow_ms = slow_ms
+        self.explain = explain
+        self.flagged = deque(maxlen=keep)  # perfiles con N+1 o consultas lentas
+        self.profiles = 0
+        self._current = contextvars.ContextVar("query_profile", default=None)
+        self._installed = False
+        self._lock = threading.Lock()
+
+    def install(self):
+        with self._lock:
+            if self._installed:
+                return
+            event.listen(self.target, "before_cursor_execute", self._before)
+            event.listen(self.target, "after_cursor_execute", self._after)
+            self._installed = True
+
+    def init_app(self, app):
+        """Un perfil por petición, con el endpoint como ruta de origen."""
+        self.install()
+
+        @app.before_request
+        def start_query_profile():
+            if self._current.get() is None:  # dentro de profile() se reutiliza
+                g._query_profile_token = self._current.set(self._new_profile(request.endpoint or request.path))
+
+        @app.teardown_request
+        def finish_query_profile(exc):
+            token = g.pop("_query_profile_token", None)
+            if token is not None:
+                profile = self._current.get()
+                self._current.reset(token)
+                self._finish(profile)
+
+    def _new_profile(self, route):
+        return QueryProfile(route, self.repeat_threshold, self.slow_ms)
+
+    @contextmanager
+    def profile(self, route="bloque"):
+        self.install()
+        profile = self._new_profile(route)
+        token = self._current.set(profile)
+        try:
+            yield profile
+        finally:
+            self._current.reset(token)
+            self._finish(profile)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        if self._current.get() is not None:
+            context._profiler_started = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        profile = self._current.get()
+        started = getattr(context, "_profiler_started", None)
+        if profile is None or started is None:
+            return
+        seconds = time.perf_counter() - started
+        profile.add(statement, seconds)
+        ms = seconds * 1000
+        if ms >= self.slow_ms:
+            plan = self._explain(conn, statement, parameters) if self.explain and not executemany else []
+            profile.slow.append((ms, statement, plan))
+            logger.warning(
+                "Consulta lenta en %s (%.1f ms): %s\n%s",
+                profile.route, ms, _SPACES.sub(" ", statement).strip(), "\n".join(plan),
+            )
+
+    def _explain(self, conn, statement, parameters):
+        if conn.dialect.name != "sqlite":
+            return []
+        # Cursor aparte en la misma conexión: el del resultado sigue sin leer
+        cursor = conn.connection.driver_connection.cursor()
+        try:
+            rows = cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ()).fetchall()
+        except Exception as e:
+            return [f"(sin plan: {e})"]
+        finally:
+            cursor.close()
+        return [row[-1] for row in rows]
+
+    def _finish(self, profile):
+        repeated = profile.repeated()
+        for count, shape, seconds in repeated:
+            logger.warning("Posible N+1 en %s: %dx (%.1f ms) %s", profile.route, count, seconds * 1000, shape)
+        with self._lock:
+            self.profiles += 1
+            if repeated or profile.slow:
+                self.flagged.append(profile)
+
+    def stats(self):
+        with self._lock:
+            flagged = list(self.flagged)
+        return {
+            "profiles": self.profiles,
+            "repeat_threshold": self.repeat_threshold,
+            "slow_ms": self.slow_ms,
+            "flagged": [p.to_dict() for p in flagged],
+        }
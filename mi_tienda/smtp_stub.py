@@ -0,0 +1,83 @@
+"""Servidor SMTP mínimo en texto plano que guarda los mensajes en memoria.
+
+Sirve para probar la cola de correo sin un servidor real:
+    python smtp_stub.py --port 1025
+y arrancar la tienda con SMTP_HOST=127.0.0.1 SMTP_PORT=1025 SMTP_USE_SSL=0
+(sin SMTP_USER, así no intenta hacer login).
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+
+class SMTPStubHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode("ascii"))
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply("220 smtp-stub listo")
+        envelope = {"from": None, "to": []}
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            command = raw.decode("utf-8", "replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self.wfile.write(b"250-smtp-stub\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n")
+            elif verb == "AUTH":
+                self.reply("235 autenticado")
+            elif verb == "MAIL":
+                envelope = {"from": command[10:].strip("<> "), "to": []}
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                envelope["to"].append(command[8:].strip("<> "))
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 termina con <CRLF>.<CRLF>")
+                lines = []
+                while True:
+                    line = self.rfile.readline()
+                    if not line or line in (b".\r\n", b".\n"):
+                        break
+                    lines.append(line[1:] if line.startswith(b"..") else line)
+                with server.lock:
+                    server.messages.append(dict(envelope, data=b"".join(lines)))
+                self.reply("250 OK encolado")
+            elif verb in ("NOOP", "RSET"):
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 adios")
+                return
+            else:
+                self.reply("502 comando no implementado")
+
+
+def start_smtp_stub(host="127.0.0.1", port=0):
+    """Arranca el stub en un hilo; los correos quedan en ``server.messages``."""
+    server = socketserver.ThreadingTCPServer((host, port), SMTPStubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.messages = []
+    server.connections = 0
+    server.port = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    args = parser.parse_args()
+    server = start_smtp_stub(args.host, args.port)
+    print(f"Stub SMTP escuchando en {args.host}:{server.port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,181 @@
+"""Cliente de Stripe para las llamadas salientes de la tienda.
+
+Reutiliza conexiones keep-alive, limita cada llamada con timeouts de
+conexión/lectura, reintenta con jitter usando la misma llave de
+idempotencia y corta rápido (circuit breaker) cuando Stripe está degradado.
+
+``gateway_from_env()`` lo configura con las variables STRIPE_*; lo usan la
+tienda y las herramientas de línea de comandos sin cargar app.py.
+"""
+import os
+import random
+import threading
+import time
+import uuid
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+import stripe
+
+load_dotenv()
+
+STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")  # sk_test_...
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE")  # p. ej. http://127.0.0.1:12111 (stripe_stub.py)
+STRIPE_CONNECT_TIMEOUT = float(os.getenv("STRIPE_CONNECT_TIMEOUT", "3.05"))
+STRIPE_READ_TIMEOUT = float(os.getenv("STRIPE_READ_TIMEOUT", "10"))
+STRIPE_MAX_RETRIES = int(os.getenv("STRIPE_MAX_RETRIES", "2"))
+STRIPE_POOL_SIZE = int(os.getenv("STRIPE_POOL_SIZE", "10"))
+STRIPE_BREAKER_THRESHOLD = int(os.getenv("STRIPE_BREAKER_THRESHOLD", "5"))
+STRIPE_BREAKER_RESET = float(os.getenv("STRIPE_BREAKER_RESET", "30"))
+
+# Errores transitorios: red, 429 y 5xx. Un 4xx normal no se reintenta.
+RETRYABLE_ERRORS = (
+    stripe.error.APIConnectionError,
+    stripe.error.RateLimitError,
+    stripe.error.APIError,
+)
+
+
+class CircuitOpenError(Exception):
+    """Se lanza sin llamar a Stripe mientras el circuito está abierto."""
+
+
+class CircuitBreaker:
+    """Abre el circuito tras ``failure_threshold`` fallos seguidos.
+
+    Pasado ``reset_timeout`` deja pasar una llamada de prueba (half-open):
+    si Stripe responde (aunque sea con un 4xx) se cierra, si falla vuelve
+    a abrirse.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+class StripeGateway:
+    def __init__(self, api_key, api_base=None, connect_timeout=3.05, read_timeout=10.0,
+                 max_retries=2, pool_size=10, backoff_base=0.25, backoff_cap=2.0,
+                 breaker=None, observer=None):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        self.client = stripe.StripeClient(
+            api_key,
+            http_client=stripe.RequestsClient(
+                timeout=(connect_timeout, read_timeout), session=session
+            ),
+            # Los reintentos los hace call() para controlar jitter y breaker
+            max_network_retries=0,
+            base_addresses={"api": api_base} if api_base else None,
+        )
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.breaker = breaker or CircuitBreaker()
+        # observer(servicio, operación, segundos, resultado) por cada intento
+        self.observer = observer
+        self.calls = 0
+        self.retries = 0
+        self.rejected = 0
+
+    def call(self, fn, idempotency_key=None, operation="call"):
+        """Ejecuta ``fn(options)`` con reintentos; ``options`` lleva la llave."""
+        options = {"idempotency_key": idempotency_key} if idempotency_key else {}
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self.rejected += 1
+                raise CircuitOpenError("Stripe no disponible (circuito abierto)")
+            self.calls += 1
+            started = time.perf_counter()
+            try:
+                result = fn(options)
+            except RETRYABLE_ERRORS:
+                self._observe(operation, started, "retryable_error")
+                self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.retries += 1
+                delay = min(self.backoff_base * 2 ** (attempt - 1), self.backoff_cap)
+                time.sleep(random.uniform(0, delay))  # full jitter
+                continue
+            except stripe.error.StripeError:
+                # Un 4xx es respuesta de Stripe: está disponible, cierra el circuito
+                self._observe(operation, started, "error")
+                self.breaker.record_success()
+                raise
+            except Exception:
+                # Sin respuesta de Stripe: una prueba half-open no se queda colgada
+                self._observe(operation, started, "error")
+                self.breaker.record_failure()
+                raise
+            self._observe(operation, started, "ok")
+            self.breaker.record_success()
+            return result
+
+    def _observe(self, operation, started, outcome):
+        if self.observer is not None:
+            self.observer("stripe", operation, time.perf_counter() - started, outcome)
+
+    def create_checkout_session(self, params, idempotency_key=None):
+        # Una llave por intento lógico: los reintentos no crean sesiones duplicadas
+        key = idempotency_key or f"checkout-{uuid.uuid4()}"
+        return self.call(
+            lambda options: self.client.v1.checkout.sessions.create(params=params, options=options),
+            idempotency_key=key,
+            operation="checkout.sessions.create",
+        )
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "breaker_state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+        }
+
+
+def gateway_from_env(observer=None):
+    """``StripeGateway`` con la llave, timeouts y breaker de las variables STRIPE_*."""
+    if not STRIPE_SECRET_KEY:
+        raise RuntimeError("Define STRIPE_SECRET_KEY en tu archivo .env")
+    return StripeGateway(
+        STRIPE_SECRET_KEY,
+        api_base=STRIPE_API_BASE,
+        connect_timeout=STRIPE_CONNECT_TIMEOUT,
+        read_timeout=STRIPE_READ_TIMEOUT,
+        max_retries=STRIPE_MAX_RETRIES,
+        pool_size=STRIPE_POOL_SIZE,
+        breaker=CircuitBreaker(STRIPE_BREAKER_THRESHOLD, STRIPE_BREAKER_RESET),
+        observer=observer,
+    )
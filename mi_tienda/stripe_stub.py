@@ -0,0 +1,126 @@
+"""Servidor HTTP local que imita la API de Stripe para pruebas y benchmarks.
+
+Uso:
+    python stripe_stub.py --port 12111 --latency 0.05 --fail-rate 0.1
+y arrancar la tienda con STRIPE_API_BASE=http://127.0.0.1:12111.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+
+class StripeStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, como la API real
+    # Cabeceras y cuerpo salen en dos writes: con Nagle y el ACK retrasado
+    # cada respuesta esperaría ~40 ms y el benchmark mediría al stub
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    @staticmethod
+    def _typed(params):
+        # Los parámetros llegan form-encoded; basta con enteros y booleanos
+        out = {}
+        for key, value in params.items():
+            if key == "unit_amount":
+                value = int(value)
+            elif value in ("true", "false"):
+                value = value == "true"
+            out[key] = value
+        return out
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        params = dict(parse_qsl(self.rfile.read(length).decode("utf-8")))
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, params, dict(self.headers)))
+        if server.latency:
+            time.sleep(server.latency)
+        if server.fail_rate and random.random() < server.fail_rate:
+            return self._send(500, {"error": {"type": "api_error", "message": "stub failure"}})
+
+        key = self.headers.get("Idempotency-Key")
+        with server.lock:
+            if key and key in server.idempotent:
+                return self._send(200, server.idempotent[key])
+
+        if self.path == "/v1/checkout/sessions":
+            session_id = f"cs_test_{uuid.uuid4().hex}"
+            body = {
+                "id": session_id,
+                "object": "checkout.session",
+                "mode": params.get("mode", "payment"),
+                "url": f"http://{self.headers.get('Host')}/pay/{session_id}",
+                "metadata": {
+                    k[len("metadata["):-1]: v for k, v in params.items() if k.startswith("metadata[")
+                },
+            }
+        elif self.path in ("/v1/products", "/v1/prices"):
+            kind = self.path.rsplit("/", 1)[1][:-1]
+            prefix = "prod" if kind == "product" else "price"
+            body = {"id": f"{prefix}_{uuid.uuid4().hex[:14]}", "object": kind, "active": True}
+            body.update(self._typed(params))
+            with server.lock:
+                server.objects[body["id"]] = body
+        elif self.path.startswith(("/v1/products/", "/v1/prices/")):
+            object_id = self.path.rsplit("/", 1)[1]
+            with server.lock:
+                body = server.objects.get(object_id)
+                if body is not None:
+                    body.update(self._typed(params))
+            if body is None:
+                return self._send(404, {"error": {"type": "invalid_request_error",
+                                                  "message": f"No such object: '{object_id}'"}})
+        else:
+            return self._send(404, {"error": {"type": "invalid_request_error",
+                                              "message": f"Unrecognized request URL ({self.path})"}})
+        with server.lock:
+            if key:
+                server.idempotent[key] = body
+        self._send(200, body)
+
+
+def start_stub_server(host="127.0.0.1", port=0, latency=0.0, fail_rate=0.0):
+    """Arranca el stub en un hilo y devuelve el servidor (``server.url``)."""
+    server = ThreadingHTTPServer((host, port), StripeStubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.fail_rate = fail_rate
+    server.lock = threading.Lock()
+    server.requests = []
+    server.idempotent = {}
+    server.objects = {}
+    server.url = f"http://{host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=12111)
+    parser.add_argument("--latency", type=float, default=0.0, help="segundos por respuesta")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fracción de respuestas 500")
+    args = parser.parse_args()
+    server = start_stub_server(args.host, args.port, args.latency, args.fail_rate)
+    print(f"Stub de Stripe escuchando en {server.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
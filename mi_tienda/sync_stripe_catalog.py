@@ -0,0 +1,137 @@
+"""Sincroniza los productos de la BD con Products/Prices de Stripe.
+
+Solo llama a Stripe para lo que cambió: productos sin sincronizar, nombre o
+descripción distintos a la última sincronización, y precios nuevos (en
+Stripe los precios son inmutables: se crea uno nuevo y se archiva el viejo).
+
+Uso:
+    python sync_stripe_catalog.py [--dry-run]
+"""
+import argparse
+import hashlib
+
+from sqlalchemy import update
+from sqlalchemy.orm.attributes import set_committed_value
+
+from models import create_db_app, db, init_db, Product
+from stripe_client import gateway_from_env
+
+CURRENCY = "usd"
+COMMIT_EVERY = 100
+
+
+def product_fingerprint(product):
+    raw = f"{product.name}\x1f{product.description or ''}".encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+def product_params(product):
+    params = {"name": product.name, "metadata": {"product_id": str(product.id)}}
+    if product.description:
+        params["description"] = product.description
+    return params
+
+
+def save_sync_state(product, **values):
+    """Guarda columnas stripe_* sin tocar ``version`` ni ``updated_at``.
+
+    Lo que ve el cliente no cambia, así que los ETag, Last-Modified y las
+    cachés del catálogo siguen valiendo.
+    """
+    table = Product.__table__
+    db.session.execute(
+        update(table)
+        .where(table.c.id == product.id)
+        .values(updated_at=table.c.updated_at, **values)  # sin el onupdate
+    )
+    for key, value in values.items():
+        set_committed_value(product, key, value)
+
+
+def sync_product(product, stripe_gateway=None, dry_run=False):
+    """Sincroniza un producto; devuelve la lista de acciones realizadas."""
+    # --dry-run no llama a Stripe: tampoco necesita el cliente ni la llave
+    client = None if dry_run else stripe_gateway.client
+    actions = []
+    fingerprint = product_fingerprint(product)
+
+    if not product.stripe_product_id:
+        actions.append("product_created")
+        if not dry_run:
+            created = stripe_gateway.call(
+                lambda options: client.v1.products.create(params=product_params(product), options=options),
+                idempotency_key=f"sync-product-{product.id}",
+                operation="products.create",
+            )
+            save_sync_state(product, stripe_product_id=created.id, stripe_synced_hash=fingerprint)
+    elif product.stripe_synced_hash != fingerprint:
+        actions.append("product_updated")
+        if not dry_run:
+            stripe_gateway.call(
+                lambda options: client.v1.products.update(
+                    product.stripe_product_id, params=product_params(product), options=options
+                ),
+                operation="products.update",
+            )
+            save_sync_state(product, stripe_synced_hash=fingerprint)
+
+    if product.stripe_price_id is None or product.stripe_price_cents != product.price_cents:
+        actions.append("price_created")
+        old_price_id = product.stripe_price_id
+        if not dry_run:
+            price = stripe_gateway.call(
+                lambda options: client.v1.prices.create(
+                    params={
+                        "product": product.stripe_product_id,
+                        "unit_amount": product.price_cents,
+                        "currency": CURRENCY,
+                    },
+                    options=options,
+                ),
+                idempotency_key=f"sync-price-{product.id}-{product.price_cents}-{old_price_id}",
+                operation="prices.create",
+            )
+            save_sync_state(product, stripe_price_id=price.id, stripe_price_cents=product.price_cents)
+            if old_price_id and old_price_id != price.id:
+                stripe_gateway.call(
+                    lambda options: client.v1.prices.update(
+                        old_price_id, params={"active": False}, options=options
+                    ),
+                    operation="prices.update",
+                )
+    return actions
+
+
+def sync_catalog(dry_run=False):
+    summary = {"product_created": 0, "product_updated": 0, "price_created": 0, "unchanged": 0}
+    app = create_db_app()
+    init_db(app)
+    stripe_gateway = None if dry_run else gateway_from_env()
+    with app.app_context():
+        pending = 0
+        for product in Product.query.order_by(Product.id):
+            actions = sync_product(product, stripe_gateway, dry_run=dry_run)
+            if not actions:
+                summary["unchanged"] += 1
+                continue
+            for action in actions:
+                summary[action] += 1
+            pending += 1
+            # Se guarda seguido para no repetir llamadas si el proceso se corta
+            if pending >= COMMIT_EVERY and not dry_run:
+                db.session.commit()
+                pending = 0
+        if not dry_run:
+            db.session.commit()
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="solo muestra qué cambiaría")
+    args = parser.parse_args()
+    summary = sync_catalog(dry_run=args.dry_run)
+    print(
+        "Productos creados: {product_created}, actualizados: {product_updated}, "
+        "precios nuevos: {price_created}, sin cambios: {unchanged}".format(**summary)
+    )
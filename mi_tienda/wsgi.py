@@ -0,0 +1,7 @@
+"""Punto de entrada WSGI: gunicorn -c gunicorn.conf.py (usa wsgi:app)."""
+from app import create_app
+from models import init_db
+
+app = create_app()
+# Con preload_app corre una sola vez, en el master, antes del fork
+init_db(app)